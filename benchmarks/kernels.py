@@ -0,0 +1,250 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import timeit
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from investr.common import growth, mortgage
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+N_LOANS = [1, 10, 100, 1000]
+TERMS = [10, 20, 40]
+RESOLUTIONS = ["yearly", "monthly"]
+
+# the memoized entry points would only measure cache hits
+get_loan_schedule = mortgage.get_loan_schedule.__wrapped__
+get_loan_summaries = mortgage.get_loan_summaries.__wrapped__
+get_roi = mortgage.get_roi.__wrapped__
+
+
+def make_loans(n_loans, n_years, seed=0):
+    rng = np.random.default_rng(seed)
+    return dict(
+        n_years=np.full(n_loans, n_years),
+        loan_total=rng.uniform(50_000, 1_000_000, n_loans),
+        interest_rate=rng.uniform(0.005, 0.04, n_loans),
+        monthly_payment=rng.uniform(500, 5_000, n_loans),
+        annual_extra_repayment_rate=rng.choice([0, 0.01, 0.05], n_loans),
+        interests_only_period=2,
+        start_month=9,
+        free_period=1,
+    )
+
+
+def make_loan(n_years):
+    return {k: np.take(v, 0).item() for k, v in make_loans(1, n_years).items()}
+
+
+def reference_kernel(loans, n_years=40):
+    # naive year by year NumPy amortization: the timings are stored relative
+    # to it, which mostly cancels out the speed of the machine
+    loan_balance = loans["loan_total"].copy()
+    for _ in range(n_years):
+        interests = loan_balance * loans["interest_rate"]
+        loan_balance -= 12 * loans["monthly_payment"] - interests
+        np.maximum(loan_balance, 0, out=loan_balance)
+    return loan_balance
+
+
+def cases():
+    for n_years in TERMS:
+        for resolution in RESOLUTIONS:
+            yield f"get_loan_schedule[{n_years}y-{resolution}]", partial(
+                get_loan_schedule, **make_loan(n_years), resolution=resolution
+            )
+
+        # the DataFrame of get_loan_summary, only built for display
+        yield f"schedule_to_frame[{n_years}y]", partial(
+            mortgage.schedule_to_frame, get_loan_schedule(**make_loan(n_years))
+        )
+
+    for n_loans in N_LOANS:
+        for n_years in TERMS:
+            for resolution in RESOLUTIONS:
+                yield f"get_loan_summaries[{n_loans}x{n_years}y-{resolution}]", partial(
+                    get_loan_summaries,
+                    **make_loans(n_loans, n_years),
+                    resolution=resolution,
+                )
+
+    for n_loans in N_LOANS:
+        summaries = get_loan_summaries(**make_loans(n_loans, 40))
+        yield f"aggregate_loan_summaries[{n_loans}x40y]", partial(
+            mortgage.aggregate_loan_summaries, summaries[..., [0, 1, 5]]
+        )
+
+    for n_years in TERMS:
+        summary = mortgage.schedule_to_frame(
+            get_loan_schedule(**make_loan(n_years))
+        ).rename(columns={"annual_interests": "interests"})
+        roi = dict(
+            yearly_agg_summary=summary,
+            property_value=1_000_000,
+            first_fee=50_000,
+            yearly_cold_rent=12_000,
+            n_years=n_years,
+            rent_increase_rate=0.02,
+            yearly_maintenance_cost=2_640,
+            yearly_property_tax=150,
+            surface=128.0,
+            property_appreciation_rate=0.015,
+        )
+        yield f"get_roi[{n_years}y]", partial(get_roi, **roi)
+        yield f"get_roi[100 scenarios x{n_years}y]", partial(
+            get_roi,
+            **dict(
+                roi,
+                property_appreciation_rate=np.linspace(0, 0.04, 10)[:, None],
+                rent_increase_rate=np.linspace(0, 0.04, 10),
+            ),
+        )
+
+    for n_paths in [1, 1_000, 100_000]:
+        for n_years in [10, 40]:
+            yield f"simulate_networth[{n_paths}x{n_years}y]", partial(
+                growth.simulate_networth,
+                np.full((n_paths, n_years), 1.07),
+                1_000,
+                6_000,
+                0,
+            )
+
+
+# Kernels faster than this are timed with SMALL_REPEAT times more repeats,
+# and a slowdown smaller than it is never a regression: at a few us, the
+# scheduling noise alone is larger than the tolerance
+NOISE_FLOOR = 50e-6
+SMALL_REPEAT = 5
+# the reference kernel is timed again every REFERENCE_EVERY cases and its
+# median is used, so that a single noisy timing does not move every ratio
+REFERENCE_EVERY = 8
+# timings of a suspected regression (the fastest one counts) and of a saved
+# baseline (the median), each next to a reference timing
+CONFIRM_RUNS = 3
+SAVE_RUNS = 5
+
+
+def measure(func, repeat):
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    timing = min(timer.repeat(repeat=repeat, number=number)) / number
+    if timing < NOISE_FLOOR:
+        timing = min(
+            timing,
+            min(timer.repeat(repeat=repeat * SMALL_REPEAT, number=number)) / number,
+        )
+    return timing
+
+
+def paired_ratios(func, measure_reference, repeat, runs):
+    # timings of func, each relative to the reference timed right before it
+    ratios = []
+    for _ in range(runs):
+        reference = measure_reference()
+        ratios.append(measure(func, repeat) / reference)
+    return ratios
+
+
+def is_regression(timing, expected, tolerance):
+    return timing > expected * (1 + tolerance) and timing - expected > NOISE_FLOOR
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Time the financial kernels relative to a reference kernel "
+        "and compare them to a baseline."
+    )
+    parser.add_argument(
+        "--save", action="store_true", help="store the timings as the new baseline"
+    )
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.3,
+        help="allowed slowdown over the baseline (0.3 = 30%%)",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("-k", default="", help="only run benchmarks containing this")
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["relative"]
+
+    measure_reference = partial(
+        measure, partial(reference_kernel, make_loans(1000, 40)), args.repeat
+    )
+    references = [measure_reference()]
+    timings = {}
+    funcs = {}
+    for name, func in cases():
+        if args.k not in name:
+            continue
+        funcs[name] = func
+        timings[name] = measure(func, args.repeat)
+        if len(timings) % REFERENCE_EVERY == 0:
+            references.append(measure_reference())
+    references.append(measure_reference())
+    reference = float(np.median(references))
+    print(f"{'reference kernel':<45} {reference * 1e6:>12,.1f} us")
+
+    relative = {}
+    regressions = []
+    for name, timing in timings.items():
+        if args.save:
+            ratios = paired_ratios(
+                funcs[name], measure_reference, args.repeat, SAVE_RUNS
+            )
+            timing = float(np.median(ratios)) * reference
+        line = f"{name:<45} {timing * 1e6:>12,.1f} us"
+        if name in baseline:
+            expected = baseline[name] * reference
+            if is_regression(timing, expected, args.tolerance):
+                # the speed of the machine drifts during a run and noise only
+                # slows kernels down: a regression is confirmed when every
+                # timing next to the reference is slower
+                ratios = paired_ratios(
+                    funcs[name], measure_reference, args.repeat, CONFIRM_RUNS
+                )
+                timing = min(timing, min(ratios) * reference)
+            line = f"{name:<45} {timing * 1e6:>12,.1f} us {timing / expected:>6.2f}x"
+            if is_regression(timing, expected, args.tolerance):
+                regressions.append(name)
+                line += "  REGRESSION"
+        relative[name] = timing / reference
+        print(line)
+
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump(
+                {
+                    "machine": platform.platform(),
+                    "python": platform.python_version(),
+                    "numpy": np.__version__,
+                    "pandas": pd.__version__,
+                    "reference": reference,
+                    "relative": relative,
+                },
+                f,
+                indent=2,
+                sort_keys=True,
+            )
+        print(f"Baseline saved to {args.baseline}")
+
+    if regressions:
+        print(
+            f"{len(regressions)} benchmarks slower than the baseline by more than {args.tolerance:.0%}"
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import argparse
+import os
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from investr.common.mortgage import LOAN_SUMMARY_COLUMNS, get_loan_summaries
+from investr.common.portfolio import PortfolioError, load_portfolio
+
+
+def load_scenarios(path):
+    # same schema as the mortgage configuration uploaded in the Combined
+    # mortgages view (YAML, JSON or CSV)
+    return load_portfolio(path)
+
+
+def evaluate_scenarios(names, loans, **kwargs):
+    # loans as given by Portfolio.loans(), one name per loan
+    summaries = get_loan_summaries(**loans, **kwargs)
+    n_loans, n_years, n_metrics = summaries.shape
+
+    df = pd.DataFrame(summaries.reshape(-1, n_metrics), columns=LOAN_SUMMARY_COLUMNS)
+    df.insert(0, "year", np.tile(np.arange(1, n_years + 1), n_loans))
+    df.insert(0, "scenario", np.repeat(names, n_years))
+
+    # drop the padding of the loans shorter than the longest one
+    terms = np.repeat(loans["n_years"], n_years)
+    return df[df["year"].to_numpy() <= terms].reset_index(drop=True)
+
+
+def _evaluate_chunk(args):
+    names, loans, kwargs = args
+    return evaluate_scenarios(names, loans, **kwargs)
+
+
+def run_batch(args):
+    try:
+        portfolio = load_scenarios(args.scenarios)
+    except (OSError, PortfolioError) as e:
+        sys.exit(f"Cannot load {args.scenarios}: {e}")
+    loans = portfolio.loans()
+    kwargs = dict(
+        start_month=args.start_month,
+        interests_only_period=args.interests_only_period,
+        free_period=args.free_period,
+        resolution=args.resolution,
+    )
+    chunks = [
+        (
+            portfolio.names[i : i + args.chunk_size],
+            {name: values[i : i + args.chunk_size] for name, values in loans.items()},
+            kwargs,
+        )
+        for i in range(0, len(portfolio), args.chunk_size)
+    ]
+
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        df = pd.concat(list(executor.map(_evaluate_chunk, chunks)), ignore_index=True)
+
+    if args.output.endswith(".parquet"):
+        df.to_parquet(args.output, index=False)
+    else:
+        df.to_csv(args.output, index=False)
+    print(
+        f"{len(portfolio)} scenarios evaluated, {len(df)} rows written to {args.output}"
+    )
+
+
+def run_app(args):
+    app = os.path.join(os.path.dirname(__file__), "run.py")
+    sys.exit(subprocess.call(["streamlit", "run", app]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="investr")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    app_parser = subparsers.add_parser("run", help="start the Streamlit app")
+    app_parser.set_defaults(func=run_app)
+
+    batch_parser = subparsers.add_parser(
+        "batch", help="evaluate a file of mortgage scenarios without the app"
+    )
+    batch_parser.add_argument("scenarios", help="YAML, JSON or CSV scenarios file")
+    batch_parser.add_argument(
+        "-o", "--output", default="results.csv", help="CSV or Parquet output file"
+    )
+    batch_parser.add_argument("--start-month", type=int, default=1)
+    batch_parser.add_argument("--interests-only-period", type=int, default=0)
+    batch_parser.add_argument("--free-period", type=int, default=0)
+    batch_parser.add_argument(
+        "--resolution", choices=["yearly", "monthly"], default="yearly"
+    )
+    batch_parser.add_argument(
+        "--workers", type=int, default=None, help="number of worker processes"
+    )
+    batch_parser.add_argument(
+        "--chunk-size", type=int, default=500, help="scenarios per worker task"
+    )
+    batch_parser.set_defaults(func=run_batch)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
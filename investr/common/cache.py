@@ -0,0 +1,136 @@
+import hashlib
+import inspect
+import json
+import threading
+from collections import OrderedDict, namedtuple
+from functools import wraps
+
+import numpy as np
+import pandas as pd
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+registry = {}
+
+
+def _normalize(value):
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    if isinstance(value, bytes):
+        # e.g. the content of an uploaded file
+        return ["bytes", hashlib.sha1(value).hexdigest()]
+    if isinstance(value, np.ndarray):
+        digest = hashlib.sha1(np.ascontiguousarray(value).tobytes()).hexdigest()
+        return ["ndarray", str(value.dtype), list(value.shape), digest]
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        frame = value.to_frame() if isinstance(value, pd.Series) else value
+        digest = hashlib.sha1(
+            pd.util.hash_pandas_object(frame, index=True).to_numpy().tobytes()
+        ).hexdigest()
+        return [
+            type(value).__name__,
+            [str(c) for c in frame.columns],
+            [str(t) for t in frame.dtypes],
+            digest,
+        ]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and value.is_integer():
+        # number inputs return 20 or 20.0 depending on their step
+        return int(value)
+    return value
+
+
+def _unhashable(value):
+    # a repr can be truncated (arrays, frames) or depend on the object id:
+    # different arguments could get the same key
+    raise TypeError(f"Cannot make a cache key of a {type(value).__name__}")
+
+
+def make_key(*parts):
+    payload = json.dumps(_normalize(parts), sort_keys=True, default=_unhashable)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def _copy(value):
+    # cached values are shared between reruns and sessions
+    if isinstance(value, (pd.DataFrame, pd.Series, np.ndarray)):
+        return value.copy()
+    if isinstance(value, tuple):
+        return tuple(_copy(v) for v in value)
+    return value
+
+
+def call_key(func, signature=None, ignore_kwargs=False):
+    # Key function of the calls to func: a hash of the normalized arguments,
+    # with the defaults applied. Keyword arguments collected by **kwargs are
+    # part of the key (as a mapping, so their order does not matter), unless
+    # ignore_kwargs: the schedule functions receive whole sidebars and drop
+    # the entries they do not know.
+    signature = inspect.signature(func) if signature is None else signature
+    ignored = {
+        name
+        for name, p in signature.parameters.items()
+        if ignore_kwargs and p.kind is inspect.Parameter.VAR_KEYWORD
+    }
+
+    def key(args, kwargs, *parts):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        return make_key(
+            func.__qualname__,
+            *parts,
+            {k: v for k, v in bound.arguments.items() if k not in ignored},
+        )
+
+    return key
+
+
+def memoize(maxsize=128, ignore_kwargs=False):
+    # LRU cache keyed on call_key
+    def decorator(func):
+        key_of = call_key(func, ignore_kwargs=ignore_kwargs)
+        cache = OrderedDict()
+        lock = threading.Lock()
+        stats = {"hits": 0, "misses": 0}
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = key_of(args, kwargs)
+
+            with lock:
+                if key in cache:
+                    cache.move_to_end(key)
+                    stats["hits"] += 1
+                    return _copy(cache[key])
+                stats["misses"] += 1
+
+            result = func(*args, **kwargs)
+
+            with lock:
+                cache[key] = result
+                while len(cache) > maxsize:
+                    cache.popitem(last=False)
+            return _copy(result)
+
+        def cache_info():
+            with lock:
+                return CacheInfo(stats["hits"], stats["misses"], maxsize, len(cache))
+
+        def cache_clear():
+            with lock:
+                cache.clear()
+                stats.update(hits=0, misses=0)
+
+        wrapper.cache_info = cache_info
+        wrapper.cache_clear = cache_clear
+        registry[f"{func.__module__}.{func.__qualname__}"] = wrapper
+        return wrapper
+
+    return decorator
+
+
+def cache_stats():
+    return {name: func.cache_info() for name, func in registry.items()}
@@ -0,0 +1,74 @@
+import numpy as np
+
+PERCENTILES = [5, 25, 50, 75, 95]
+# Smallest gross yearly return of the normal distribution, a 99.9% loss: a
+# value cannot go below 0 and simulate_networth divides by the cumulated
+# returns, so they must stay positive
+MIN_GROSS_RETURN = 1e-3
+
+
+def simulate_annual_returns(
+    annual_gain, volatility, n_years, n_paths, distribution="normal", seed=None
+):
+    # Gross yearly returns of shape (n_paths, n_years) with the given arithmetic
+    # mean and standard deviation. Normal returns are floored at
+    # MIN_GROSS_RETURN.
+    rng = np.random.default_rng(seed)
+    returns = rng.standard_normal((n_paths, n_years))
+
+    if distribution == "normal":
+        returns *= volatility
+        returns += 1 + annual_gain
+        np.maximum(returns, MIN_GROSS_RETURN, out=returns)
+    elif distribution == "log-normal":
+        sigma = np.sqrt(np.log1p((volatility / (1 + annual_gain)) ** 2))
+        returns *= sigma
+        returns += np.log1p(annual_gain) - sigma ** 2 / 2
+        np.exp(returns, out=returns)
+    else:
+        raise ValueError(f"Unknown return distribution: {distribution}")
+
+    return returns
+
+
+def simulate_networth(returns, starting_value, annual_invest, yearly_extra):
+    # networth[y] = (networth[y - 1] + annual_invest) * returns[y] + yearly_extra,
+    # solved for all paths at once with cumulative ops (and in place, as the
+    # arrays get large): the starting value is prepended as year 0.
+    growth = np.cumprod(returns, axis=-1)
+    networth = returns * annual_invest
+    networth += yearly_extra
+    networth /= growth
+    np.cumsum(networth, axis=-1, out=networth)
+    networth += starting_value
+    networth *= growth
+
+    start = np.full(networth.shape[:-1] + (1,), float(starting_value))
+    return np.concatenate([start, networth], axis=-1)
+
+
+def get_invested(starting_value, annual_invest, yearly_extra, n_years):
+    return starting_value + np.arange(n_years + 1) * float(annual_invest + yearly_extra)
+
+
+def get_percentiles(paths, percentiles=PERCENTILES):
+    return np.percentile(paths, percentiles, axis=0)
+
+
+def simulate_paths(
+    annual_gain,
+    volatility,
+    n_years,
+    n_paths,
+    distribution,
+    seed,
+    starting_value,
+    annual_invest,
+    yearly_extra,
+):
+    # (path, year) networth of a Monte Carlo simulation, in one call that can
+    # be run by a worker process (seed may be a sequence, e.g. (seed, chunk))
+    returns = simulate_annual_returns(
+        annual_gain, volatility, n_years, n_paths, distribution, seed
+    )
+    return simulate_networth(returns, starting_value, annual_invest, yearly_extra)
@@ -0,0 +1,146 @@
+import hashlib
+import io
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# Directory of the return series (.csv or .npy) offered in the app, and the
+# one where converted CSV files are cached as .npy
+DATA_DIR = os.environ.get(
+    "INVESTR_DATA_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+)
+CACHE_DIR = os.environ.get(
+    "INVESTR_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "investr")
+)
+
+
+class ReturnSeries:
+    # Monthly simple returns (0.01 = 1%) of shape (month, asset), usually a
+    # read-only memory map, with the asset names and the first month
+    # ("YYYY-MM", None when unknown).
+    def __init__(self, returns, columns, start=None):
+        self.returns = returns
+        self.columns = columns
+        self.start = start
+
+    def __len__(self):
+        return len(self.returns)
+
+    def months(self):
+        if self.start is None:
+            return pd.RangeIndex(len(self), name="month")
+        return pd.period_range(self.start, periods=len(self), freq="M")
+
+
+def list_return_series(data_dir=DATA_DIR):
+    if not os.path.isdir(data_dir):
+        return []
+    return sorted(
+        os.path.join(data_dir, name)
+        for name in os.listdir(data_dir)
+        if name.endswith((".csv", ".npy"))
+    )
+
+
+def _convert_csv(source, key, cache_dir):
+    # CSV with the months in the first column and one column of monthly
+    # returns per asset, parsed once and stored as .npy next to a small JSON
+    # with the column names and the first month
+    path = os.path.join(cache_dir, key + ".npy")
+    meta_path = os.path.join(cache_dir, key + ".json")
+    if not (os.path.exists(path) and os.path.exists(meta_path)):
+        df = pd.read_csv(source, index_col=0)
+        if df.empty:
+            raise ValueError("The return series has no rows")
+        returns = df.to_numpy(dtype=float)
+        if np.isnan(returns).any():
+            raise ValueError("The return series has missing values")
+        start = pd.Period(pd.to_datetime(df.index[0]), freq="M")
+
+        os.makedirs(cache_dir, exist_ok=True)
+        np.save(path, returns)
+        with open(meta_path, "w") as f:
+            json.dump({"columns": list(map(str, df.columns)), "start": str(start)}, f)
+
+    with open(meta_path) as f:
+        meta = json.load(f)
+    return ReturnSeries(np.load(path, mmap_mode="r"), meta["columns"], meta["start"])
+
+
+def load_return_series(source, name=None, cache_dir=CACHE_DIR):
+    # source is a path or the bytes of an uploaded file (then name gives its
+    # extension). A .npy holds the (month, asset) or (month,) returns and is
+    # memory-mapped as is; a CSV is converted to a cached .npy keyed by its
+    # content (uploads) or path and modification time (local files).
+    name = source if name is None else name
+    if isinstance(source, bytes):
+        key = hashlib.sha1(source).hexdigest()
+        if name.endswith(".npy"):
+            os.makedirs(cache_dir, exist_ok=True)
+            path = os.path.join(cache_dir, key + ".npy")
+            if not os.path.exists(path):
+                with open(path, "wb") as f:
+                    f.write(source)
+            source = path
+        else:
+            return _convert_csv(io.BytesIO(source), key, cache_dir)
+    elif not name.endswith(".npy"):
+        stat = os.stat(source)
+        key = hashlib.sha1(
+            f"{os.path.abspath(source)}:{stat.st_mtime_ns}:{stat.st_size}".encode()
+        ).hexdigest()
+        return _convert_csv(source, key, cache_dir)
+
+    returns = np.load(source, mmap_mode="r")
+    if returns.ndim == 1:
+        returns = returns[:, None]
+    if returns.ndim != 2:
+        raise ValueError(f"Expected (month, asset) returns, got shape {returns.shape}")
+    columns = [f"asset {n + 1}" for n in range(returns.shape[1])]
+    return ReturnSeries(returns, columns)
+
+
+def backtest_networth(
+    monthly_returns, n_years, starting_value, monthly_invest, yearly_extra
+):
+    # Final networth of the savings plan for every start month of the series:
+    # each month networth = (networth + monthly_invest) * (1 + return), plus
+    # yearly_extra at the end of every year of the window. With the cumulated
+    # log-growth L, money invested at month k is worth exp(L[end] - L[k]) at
+    # the end of the window, so all windows come from prefix sums of exp(-L)
+    # in O(n). Returns an array of shape (start month, asset).
+    returns = np.asarray(monthly_returns, dtype=float)
+    n_months = 12 * int(n_years)
+    n_windows = len(returns) - n_months + 1
+    if n_windows < 1:
+        raise ValueError(
+            f"The return series has {len(returns)} months, "
+            f"fewer than the {n_months} months of the investment horizon"
+        )
+
+    log_growth = np.zeros((len(returns) + 1,) + returns.shape[1:])
+    np.cumsum(np.log1p(returns), axis=0, out=log_growth[1:])
+    discount = np.exp(-log_growth)
+
+    # monthly investments made at the start of the months [0, k)
+    invested = np.zeros(log_growth.shape)
+    np.cumsum(discount[:-1], axis=0, out=invested[1:])
+
+    # yearly extras made at months k, k - 12, k - 24, ...: cumulated along
+    # each residue of the month modulo 12
+    n_padded = -(-len(discount) // 12) * 12
+    extras = np.zeros((n_padded,) + discount.shape[1:])
+    extras[: len(discount)] = discount
+    extras = np.cumsum(extras.reshape((-1, 12) + discount.shape[1:]), axis=0)
+    extras = extras.reshape((n_padded,) + discount.shape[1:])[: len(discount)]
+
+    start = np.arange(n_windows)
+    end = start + n_months
+    final_growth = np.exp(log_growth[end])
+    return (
+        starting_value * final_growth * discount[start]
+        + monthly_invest * final_growth * (invested[end] - invested[start])
+        + yearly_extra * final_growth * (extras[end] - extras[start])
+    )
@@ -1,6 +1,309 @@
+import numpy as np
 import pandas as pd
 
+from investr.common.cache import memoize
 
+LOAN_SUMMARY_COLUMNS = [
+    "monthly_interests",
+    "monthly_principal",
+    "annual_interests",
+    "annual_principal",
+    "extra repayment",
+    "loan balance",
+]
+
+MONTHLY_SUMMARY_COLUMNS = [
+    "interests",
+    "principal",
+    "extra repayment",
+    "loan balance",
+]
+
+# Compact schedules: one record per year (or month) with the summary columns,
+# turned into DataFrames by schedule_to_frame only where they are displayed
+LOAN_SCHEDULE_DTYPE = np.dtype(
+    [("year", np.int64)] + [(c, np.float64) for c in LOAN_SUMMARY_COLUMNS]
+)
+MONTHLY_SCHEDULE_DTYPE = np.dtype(
+    [("year", np.int64), ("month", np.int64)]
+    + [(c, np.float64) for c in MONTHLY_SUMMARY_COLUMNS]
+)
+
+
+def _to_schedule(dtype, *columns):
+    schedule = np.empty(len(columns[0]), dtype=dtype)
+    for name, values in zip(dtype.names, columns):
+        schedule[name] = values
+    return schedule
+
+
+def schedule_to_frame(schedule):
+    index = [name for name in ("year", "month") if name in schedule.dtype.names]
+    return pd.DataFrame(schedule).set_index(index)
+
+
+def _solve_linear_recurrence(a, c, x0):
+    # x[t] = a[t] * x[t - 1] + c[t], solved along the last axis with cumulative ops
+    growth = np.cumprod(a, axis=-1)
+    x = c / growth
+    np.cumsum(x, axis=-1, out=x)
+    x += np.asarray(x0)[..., None]
+    x *= growth
+    return x
+
+
+def _stop_at_payoff(loan_balance, loan_total, period_rate, payment, extra_repayment):
+    # The balance recurrences keep the payments going once a loan is repaid,
+    # so that the balance turns negative and earns negative interests. From
+    # the first period where it reaches 0 the balance stays at 0, and the
+    # payments of that period are cut to what is due: the regular payment
+    # first, then the extra repayment.
+    repaid = loan_balance <= 0
+    if repaid.any():
+        repaid = np.logical_or.accumulate(repaid, axis=-1)
+        loan_balance = np.where(repaid, 0.0, loan_balance)
+    previous_balance = np.concatenate(
+        [
+            np.broadcast_to(loan_total, loan_balance.shape[:-1] + (1,)),
+            loan_balance[..., :-1],
+        ],
+        axis=-1,
+    )
+    interests = previous_balance * period_rate
+    if repaid.any():
+        due = previous_balance + interests
+        payment = np.minimum(payment, due)
+        extra_repayment = np.minimum(extra_repayment, due - payment)
+    return loan_balance, interests, payment, extra_repayment
+
+
+def _amortize(
+    n_years,
+    loan_total,
+    interest_rate,
+    monthly_payment,
+    annual_extra_repayment_rate,
+    interests_only_period,
+    start_month,
+    free_period,
+):
+    (
+        n_years,
+        loan_total,
+        interest_rate,
+        monthly_payment,
+        annual_extra_repayment_rate,
+        interests_only_period,
+        start_month,
+        free_period,
+    ) = (
+        np.asarray(p, dtype=float)[..., None]
+        for p in (
+            n_years,
+            loan_total,
+            interest_rate,
+            monthly_payment,
+            annual_extra_repayment_rate,
+            interests_only_period,
+            start_month,
+            free_period,
+        )
+    )
+
+    # Loans are aligned on the longest term; past its own term a loan keeps
+    # its residual balance and has no more cash flows.
+    years = np.arange(1, int(n_years.max(initial=0)) + 1)
+    n_months = np.where(years > 1, 12, 13 - start_month)
+    active = years <= np.floor(n_years)
+    accrues = active & (years > free_period)
+    repays = active & (years > interests_only_period)
+
+    period_rate = np.where(accrues, interest_rate * n_months / 12, 0.0)
+    annual_extra_repayment = np.where(
+        repays, loan_total * annual_extra_repayment_rate, 0.0
+    )
+    annual_payment = np.where(repays, monthly_payment * n_months, 0.0)
+
+    # The balance only moves once repayments start: it grows by the interests
+    # of the period and shrinks by the payments and the extra repayment.
+    loan_balance = _solve_linear_recurrence(
+        1 + period_rate * repays,
+        -(annual_payment + annual_extra_repayment),
+        loan_total[..., 0],
+    )
+    (
+        loan_balance,
+        annual_interests,
+        annual_payment,
+        annual_extra_repayment,
+    ) = _stop_at_payoff(
+        loan_balance, loan_total, period_rate, annual_payment, annual_extra_repayment
+    )
+
+    monthly_interests = annual_interests / n_months
+    annual_principal = np.where(repays, annual_payment - annual_interests, 0.0)
+    monthly_principal = annual_principal / n_months
+
+    summary = np.stack(
+        np.broadcast_arrays(
+            monthly_interests,
+            monthly_principal,
+            annual_interests,
+            annual_principal,
+            annual_extra_repayment,
+            loan_balance,
+        ),
+        axis=-1,
+    )
+    return years, summary
+
+
+def _amortize_monthly(
+    n_years,
+    loan_total,
+    interest_rate,
+    monthly_payment,
+    annual_extra_repayment_rate,
+    interests_only_period,
+    start_month,
+    free_period,
+):
+    (
+        n_years,
+        loan_total,
+        interest_rate,
+        monthly_payment,
+        annual_extra_repayment_rate,
+        interests_only_period,
+        start_month,
+        free_period,
+    ) = (
+        np.asarray(p, dtype=float)[..., None]
+        for p in (
+            np.floor(n_years),
+            loan_total,
+            interest_rate,
+            monthly_payment,
+            annual_extra_repayment_rate,
+            interests_only_period,
+            start_month,
+            free_period,
+        )
+    )
+
+    # Same conventions as the yearly schedule, month by month: the first year
+    # has 13 - start_month months and the extra repayment is made at the end
+    # of each year.
+    months = np.arange(int((12 * n_years - start_month + 1).max(initial=0)))
+    calendar_months = months + (start_month - 1).astype(int)
+    years = calendar_months // 12 + 1
+    year_ends = calendar_months % 12 == 11
+
+    active = years <= n_years
+    accrues = active & (years > free_period)
+    repays = active & (years > interests_only_period)
+
+    monthly_rate = np.where(accrues, interest_rate / 12, 0.0)
+    extra_repayment = np.where(
+        repays & year_ends, loan_total * annual_extra_repayment_rate, 0.0
+    )
+    payment = np.where(repays, monthly_payment, 0.0)
+
+    loan_balance = _solve_linear_recurrence(
+        1 + monthly_rate * repays,
+        -(payment + extra_repayment),
+        loan_total[..., 0],
+    )
+    loan_balance, interests, payment, extra_repayment = _stop_at_payoff(
+        loan_balance, loan_total, monthly_rate, payment, extra_repayment
+    )
+    principal = np.where(repays, payment - interests, 0.0)
+
+    # kept metric by metric (MONTHLY_SUMMARY_COLUMNS), the roll-up reduces
+    # each of them along the months
+    return years, np.broadcast_arrays(
+        interests, principal, extra_repayment, loan_balance
+    )
+
+
+def _rollup_monthly(n_years, start_month, schedule):
+    # Yearly LOAN_SUMMARY_COLUMNS from a monthly schedule, by reading the
+    # cumulated flows and the balance at the last month of each year.
+    interests, principal, extra_repayment, loan_balance = schedule
+    n_years, start_month = np.broadcast_arrays(
+        np.floor(np.asarray(n_years, dtype=float))[..., None],
+        np.asarray(start_month, dtype=float)[..., None],
+    )
+    years = np.arange(1, int(n_years.max(initial=0)) + 1)
+    n_months = np.where(years > 1, 12, 13 - start_month)
+
+    last_month = np.cumsum(n_months, axis=-1).astype(int) - 1
+    last_month = np.minimum(last_month, loan_balance.shape[-1] - 1)
+    last_month = np.broadcast_to(
+        last_month, loan_balance.shape[:-1] + last_month.shape[-1:]
+    )
+
+    def year_end_values(values):
+        return np.take_along_axis(values, last_month, axis=-1)
+
+    def annual_sums(flows):
+        return np.diff(year_end_values(np.cumsum(flows, axis=-1)), axis=-1, prepend=0.0)
+
+    annual_interests = annual_sums(interests)
+    annual_principal = annual_sums(principal)
+    summary = np.stack(
+        [
+            annual_interests / n_months,
+            annual_principal / n_months,
+            annual_interests,
+            annual_principal,
+            annual_sums(extra_repayment),
+            year_end_values(loan_balance),
+        ],
+        axis=-1,
+    )
+    return years, summary
+
+
+def _amortize_by_resolution(resolution, *params):
+    if resolution == "yearly":
+        return _amortize(*params)
+    if resolution == "monthly":
+        n_years, start_month = params[0], params[6]
+        _, schedule = _amortize_monthly(*params)
+        return _rollup_monthly(n_years, start_month, schedule)
+    raise ValueError(f"Unknown schedule resolution: {resolution}")
+
+
+@memoize(maxsize=256, ignore_kwargs=True)
+def get_loan_schedule(
+    n_years,
+    loan_total,
+    interest_rate,
+    monthly_payment,
+    annual_extra_repayment_rate=0,
+    interests_only_period=0,
+    start_month=1,
+    free_period=0,
+    resolution="yearly",
+    **kwargs,
+):
+    # get_loan_summary as a LOAN_SCHEDULE_DTYPE structured array
+    years, summary = _amortize_by_resolution(
+        resolution,
+        n_years,
+        loan_total,
+        interest_rate,
+        monthly_payment,
+        annual_extra_repayment_rate,
+        interests_only_period,
+        start_month,
+        free_period,
+    )
+    return _to_schedule(LOAN_SCHEDULE_DTYPE, years, *np.moveaxis(summary, -1, 0))
+
+
+@memoize(maxsize=256, ignore_kwargs=True)
 def get_loan_summary(
     n_years,
     loan_total,
@@ -10,52 +313,576 @@ def get_loan_summary(
     interests_only_period=0,
     start_month=1,
     free_period=0,
+    resolution="yearly",
     **kwargs,
 ):
-    loan_balance = loan_total
-    data = []
-    for y in range(1, int(n_years) + 1):
-        n_months = 12 if y > 1 else 13 - start_month
+    return schedule_to_frame(
+        get_loan_schedule(
+            n_years,
+            loan_total,
+            interest_rate,
+            monthly_payment,
+            annual_extra_repayment_rate,
+            interests_only_period,
+            start_month,
+            free_period,
+            resolution,
+        )
+    )
+
+
+@memoize(maxsize=64, ignore_kwargs=True)
+def get_monthly_loan_schedule(
+    n_years,
+    loan_total,
+    interest_rate,
+    monthly_payment,
+    annual_extra_repayment_rate=0,
+    interests_only_period=0,
+    start_month=1,
+    free_period=0,
+    **kwargs,
+):
+    # get_monthly_loan_summary as a MONTHLY_SCHEDULE_DTYPE structured array
+    years, schedule = _amortize_monthly(
+        n_years,
+        loan_total,
+        interest_rate,
+        monthly_payment,
+        annual_extra_repayment_rate,
+        interests_only_period,
+        start_month,
+        free_period,
+    )
+    months = (np.arange(len(years)) + int(start_month) - 1) % 12 + 1
+    return _to_schedule(MONTHLY_SCHEDULE_DTYPE, years, months, *schedule)
+
+
+@memoize(maxsize=64, ignore_kwargs=True)
+def get_monthly_loan_summary(
+    n_years,
+    loan_total,
+    interest_rate,
+    monthly_payment,
+    annual_extra_repayment_rate=0,
+    interests_only_period=0,
+    start_month=1,
+    free_period=0,
+    **kwargs,
+):
+    return schedule_to_frame(
+        get_monthly_loan_schedule(
+            n_years,
+            loan_total,
+            interest_rate,
+            monthly_payment,
+            annual_extra_repayment_rate,
+            interests_only_period,
+            start_month,
+            free_period,
+        )
+    )
+
+
+@memoize(maxsize=64)
+def get_loan_summaries(
+    n_years,
+    loan_total,
+    interest_rate,
+    monthly_payment,
+    annual_extra_repayment_rate=0,
+    interests_only_period=0,
+    start_month=1,
+    free_period=0,
+    resolution="yearly",
+):
+    # Batched get_loan_summary: parameters are broadcast against each other and
+    # the result is a (loan, year, metric) array, metrics following
+    # LOAN_SUMMARY_COLUMNS. Years run from 1 to the longest term; after its own
+    # term a loan has no cash flows and keeps its residual balance.
+    _, summary = _amortize_by_resolution(
+        resolution,
+        np.atleast_1d(n_years),
+        loan_total,
+        interest_rate,
+        monthly_payment,
+        annual_extra_repayment_rate,
+        interests_only_period,
+        start_month,
+        free_period,
+    )
+    return summary
 
-        annual_interests = 0
-        if y > free_period:
-            annual_interests = loan_balance * interest_rate * (n_months / 12)
-        monthly_interests = annual_interests / n_months
-
-        monthly_principal = 0
-        annual_principal = 0
-        annual_extra_repayment = 0
-        if y > interests_only_period:
-            monthly_principal = monthly_payment - monthly_interests
-            annual_principal = monthly_principal * n_months
-            loan_balance -= annual_principal
-            annual_extra_repayment = loan_total * annual_extra_repayment_rate
-            loan_balance -= annual_extra_repayment
-
-        data.append(
-            [
-                y,
-                monthly_interests,
-                monthly_principal,
-                annual_interests,
-                annual_principal,
-                annual_extra_repayment,
-                loan_balance,
-            ]
+
+def aggregate_loan_summaries(summaries):
+    # (loan, year, metric) -> (metric, loan, year) with the sum over all loans
+    # appended as a last "loan"
+    data = np.moveaxis(summaries, -1, 0)
+    return np.concatenate([data, data.sum(axis=1, keepdims=True)], axis=1)
+
+
+def _amortize_totals(
+    n_years,
+    loan_total,
+    interest_rate,
+    monthly_payment,
+    annual_extra_repayment_rate,
+    interests_only_period,
+    start_month,
+    free_period,
+    rate_paths=None,
+    payoff_year=False,
+):
+    # Total paid interests and residual balance of _amortize, without keeping
+    # the yearly schedule: memory stays proportional to the number of loans,
+    # which is what large parameter sweeps and solvers need. rate_paths of
+    # shape (..., year) replace interest_rate year by year, the last rate
+    # applying past the end of the paths. With payoff_year, the year in which
+    # each loan is repaid (NaN if it is not within its term) comes third.
+    if rate_paths is not None:
+        rate_paths = np.asarray(rate_paths, dtype=float)
+        interest_rate = rate_paths[..., 0]
+    (
+        n_years,
+        loan_total,
+        interest_rate,
+        monthly_payment,
+        annual_extra_repayment_rate,
+        interests_only_period,
+        start_month,
+        free_period,
+    ) = np.broadcast_arrays(
+        *[
+            np.asarray(p, dtype=float)
+            for p in (
+                np.floor(n_years),
+                loan_total,
+                interest_rate,
+                monthly_payment,
+                annual_extra_repayment_rate,
+                interests_only_period,
+                start_month,
+                free_period,
+            )
+        ]
+    )
+    annual_extra_repayment = loan_total * annual_extra_repayment_rate
+    loan_balance = loan_total.copy()
+    total_interests = np.zeros(loan_balance.shape)
+    repaid_in = np.full(loan_balance.shape, np.nan)
+
+    for y in range(1, int(n_years.max(initial=0)) + 1):
+        n_months = 12 if y > 1 else 13 - start_month
+        active = y <= n_years
+        if rate_paths is not None:
+            interest_rate = rate_paths[..., min(y, rate_paths.shape[-1]) - 1]
+        annual_interests = np.where(
+            active & (y > free_period),
+            loan_balance * interest_rate * (n_months / 12),
+            0.0,
         )
-    cols = [
-        "year",
-        "monthly_interests",
-        "monthly_principal",
-        "annual_interests",
-        "annual_principal",
-        "extra repayment",
-        "loan balance",
+        total_interests += annual_interests
+        # repaid loans stop paying, see _stop_at_payoff
+        due = loan_balance + annual_interests
+        payment = np.minimum(monthly_payment * n_months, due)
+        extra_repayment = np.minimum(annual_extra_repayment, due - payment)
+        repays = active & (y > interests_only_period)
+        loan_balance = np.where(repays, due - payment - extra_repayment, loan_balance)
+        if payoff_year:
+            repaid_in[repays & (loan_balance <= 0) & np.isnan(repaid_in)] = y
+
+    if payoff_year:
+        return total_interests, loan_balance, repaid_in
+    return total_interests, loan_balance
+
+
+@memoize(maxsize=16)
+def get_loan_totals(
+    n_years,
+    loan_total,
+    interest_rate,
+    monthly_payment,
+    annual_extra_repayment_rate=0,
+    interests_only_period=0,
+    start_month=1,
+    free_period=0,
+    payoff_year=False,
+):
+    return _amortize_totals(
+        n_years,
+        loan_total,
+        interest_rate,
+        monthly_payment,
+        annual_extra_repayment_rate,
+        interests_only_period,
+        start_month,
+        free_period,
+        payoff_year=payoff_year,
+    )
+
+
+def get_variable_rate_totals(
+    n_years,
+    loan_total,
+    rate_paths,
+    monthly_payment,
+    annual_extra_repayment_rate=0,
+    interests_only_period=0,
+    start_month=1,
+    free_period=0,
+):
+    # get_loan_totals with yearly interest rate paths of shape (..., year),
+    # e.g. thousands of simulated paths, instead of a single interest rate.
+    # The monthly payment stays fixed, so rates above the initial one slow
+    # down the repayment (the balance grows when they exceed the payments).
+    return _amortize_totals(
+        n_years,
+        loan_total,
+        None,
+        monthly_payment,
+        annual_extra_repayment_rate,
+        interests_only_period,
+        start_month,
+        free_period,
+        rate_paths,
+    )
+
+
+def get_refinancing_tree(
+    n_years,
+    loan_total,
+    interest_rate,
+    monthly_payment,
+    follow_up_rates,
+    follow_up_years,
+    n_refinancings=1,
+    probabilities=None,
+    annual_extra_repayment_rate=0,
+    interests_only_period=0,
+    start_month=1,
+    free_period=0,
+):
+    # Scenario tree of follow-up financings: at the end of each fixed-rate
+    # period the residual balance is refinanced with one of the branches
+    # (follow_up_rates[j] for follow_up_years[j], with probabilities[j],
+    # uniform by default) and the same monthly payment, n_refinancings times.
+    # The tree is evaluated level by level: the balance and interests of a
+    # node are computed once and shared by all its descendants, and all the
+    # nodes of a level are a single batched call of _amortize_totals.
+    # Returns the lifetime interests, the final balance and the probability
+    # of every leaf, of shape (*loans, leaf), and the (leaf, refinancing)
+    # branch indices.
+    follow_up_rates, follow_up_years = np.broadcast_arrays(
+        np.asarray(follow_up_rates, dtype=float).ravel(),
+        np.asarray(follow_up_years, dtype=float).ravel(),
+    )
+    n_branches = len(follow_up_rates)
+    if probabilities is None:
+        probabilities = np.ones(n_branches)
+    probabilities = np.broadcast_to(np.asarray(probabilities, dtype=float), n_branches)
+    if (probabilities < 0).any() or probabilities.sum() <= 0:
+        raise ValueError("Branch probabilities must be positive")
+    probabilities = probabilities / probabilities.sum()
+
+    total_interests, loan_balance = _amortize_totals(
+        n_years,
+        loan_total,
+        interest_rate,
+        monthly_payment,
+        annual_extra_repayment_rate,
+        interests_only_period,
+        start_month,
+        free_period,
+    )
+    total_interests = total_interests[..., None]
+    loan_balance = loan_balance[..., None]
+    probability = np.ones(1)
+    monthly_payment = np.asarray(monthly_payment, dtype=float)[..., None, None]
+    annual_extra_repayment_rate = np.asarray(annual_extra_repayment_rate)[
+        ..., None, None
     ]
-    df = pd.DataFrame(data, columns=cols).set_index("year")
-    return df
+
+    for _ in range(n_refinancings):
+        # (*loans, node, branch): every node of the level refinanced with
+        # every branch, repaid loans have nothing left to refinance
+        interests, loan_balance = _amortize_totals(
+            follow_up_years,
+            loan_balance[..., None],
+            follow_up_rates,
+            monthly_payment,
+            annual_extra_repayment_rate,
+            0,
+            1,
+            0,
+        )
+        total_interests = total_interests[..., None] + interests
+        shape = total_interests.shape[:-2] + (-1,)
+        total_interests = total_interests.reshape(shape)
+        loan_balance = loan_balance.reshape(shape)
+        probability = (probability[:, None] * probabilities).ravel()
+
+    branches = np.indices((n_branches,) * n_refinancings).reshape(n_refinancings, -1)
+    return {
+        "total interests": total_interests,
+        "loan balance": loan_balance,
+        "probability": probability,
+        "branches": branches.T,
+    }
+
+
+LOAN_PARAMETERS = [
+    "n_years",
+    "loan_total",
+    "interest_rate",
+    "monthly_payment",
+    "annual_extra_repayment_rate",
+    "interests_only_period",
+    "start_month",
+    "free_period",
+]
+LOAN_DEFAULTS = dict(
+    annual_extra_repayment_rate=0,
+    interests_only_period=0,
+    start_month=1,
+    free_period=0,
+)
+
+
+def _bisect_decreasing(func, target, lower, upper, n_iterations):
+    # Smallest x in [lower, upper] with func(x) <= target for a decreasing
+    # func, for a whole batch at once. NaN where even upper misses the target.
+    lower, upper, target = np.broadcast_arrays(
+        np.asarray(lower, dtype=float), np.asarray(upper, dtype=float), target
+    )
+    feasible = func(upper) <= target
+    for _ in range(n_iterations):
+        middle = (lower + upper) / 2
+        reached = func(middle) <= target
+        lower = np.where(reached, lower, middle)
+        upper = np.where(reached, middle, upper)
+    return np.where(feasible, upper, np.nan)
+
+
+def solve_loan(
+    solve_for,
+    target_balance=0.0,
+    max_total_interests=None,
+    lower=None,
+    upper=None,
+    max_n_years=40,
+    n_iterations=60,
+    **kwargs,
+):
+    # Goal seek on a batch of loans (parameters as for get_loan_summaries, the
+    # solved one is ignored): the smallest monthly_payment,
+    # annual_extra_repayment_rate or n_years for which the residual balance is
+    # at most target_balance (0 = repaid in n_years), or, when given, the
+    # total paid interests are at most max_total_interests (for n_years, the
+    # shortest term reaching target_balance within max_total_interests). NaN
+    # when the target cannot be reached, e.g. interests below the ones paid
+    # before the repayments start.
+    params = {**LOAN_DEFAULTS, **kwargs}
+    params = {
+        k: np.asarray(params[k], dtype=float) for k in LOAN_PARAMETERS if k in params
+    }
+    metric = 1 if max_total_interests is None else 0
+    target = target_balance if max_total_interests is None else max_total_interests
+
+    if solve_for == "n_years":
+        # the paid interests only grow with the term: the shortest term
+        # reaching target_balance, NaN if its interests exceed
+        # max_total_interests
+        params["n_years"] = max_n_years
+        _, summary = _amortize(*[params[k] for k in LOAN_PARAMETERS])
+        balance = summary[..., LOAN_SUMMARY_COLUMNS.index("loan balance")]
+        reached = balance <= np.asarray(target_balance, dtype=float)[..., None]
+        n_years = np.where(reached.any(axis=-1), reached.argmax(axis=-1) + 1.0, np.nan)
+        if max_total_interests is not None:
+            interests = np.cumsum(
+                summary[..., LOAN_SUMMARY_COLUMNS.index("annual_interests")], axis=-1
+            )
+            interests = np.take_along_axis(
+                interests,
+                np.nan_to_num(n_years - 1).astype(int)[..., None],
+                axis=-1,
+            )[..., 0]
+            n_years = np.where(
+                interests <= np.asarray(max_total_interests, dtype=float),
+                n_years,
+                np.nan,
+            )
+        return n_years
+
+    if solve_for == "monthly_payment":
+        # paying the loan grown at its rate over the whole term within the first
+        # repayment year clears it, and leaves as few interests as possible
+        first_repayment_months = np.where(
+            params["interests_only_period"] < 1, 13 - params["start_month"], 12
+        )
+        default_upper = (
+            params["loan_total"]
+            * (1 + params["interest_rate"]) ** np.floor(params["n_years"])
+            / first_repayment_months
+        )
+    elif solve_for == "annual_extra_repayment_rate":
+        default_upper = 1.0
+    else:
+        raise ValueError(f"Cannot solve for {solve_for}")
+
+    def func(x):
+        return _amortize_totals(
+            *[x if k == solve_for else params[k] for k in LOAN_PARAMETERS]
+        )[metric]
+
+    return _bisect_decreasing(
+        func,
+        target,
+        0.0 if lower is None else lower,
+        default_upper if upper is None else upper,
+        n_iterations,
+    )
 
 
+# largest number of tranches of optimize_extra_repayments
+MAX_OPTIMIZED_TRANCHES = 100
+
+
+def optimize_extra_repayments(
+    budget, caps=None, objective="total_interests", n_steps=20, **kwargs
+):
+    # Share a yearly extra repayment budget between the tranches of a
+    # mortgage (parameters as for get_loan_summaries, one value per tranche,
+    # annual_extra_repayment_rate is ignored) so that the summed total paid
+    # interests or residual balance at the end of each tranche term is the
+    # smallest. The budget is split in n_steps units and caps are the largest
+    # yearly extra repayment of each tranche.
+    # The objective is a sum over the tranches, each depending on its own
+    # allocation: every (units, tranche) pair is evaluated in a single batch
+    # and the best split of the units is solved by dynamic programming over
+    # the tranches, in O(tranches * n_steps^2).
+    # Returns the yearly extra repayment, total paid interests and residual
+    # balance of each tranche.
+    params = {**LOAN_DEFAULTS, **kwargs}
+    params = {
+        k: np.atleast_1d(np.asarray(params[k], dtype=float))
+        for k in LOAN_PARAMETERS
+        if k in params
+    }
+    loan_total = np.broadcast_to(params["loan_total"], params["n_years"].shape)
+    n_tranches = len(loan_total)
+    if n_tranches > MAX_OPTIMIZED_TRANCHES:
+        raise ValueError(
+            f"Cannot optimize more than {MAX_OPTIMIZED_TRANCHES} tranches, "
+            f"got {n_tranches}"
+        )
+    caps = np.broadcast_to(budget if caps is None else caps, loan_total.shape)
+
+    step = budget / n_steps if budget > 0 else 0.0
+    cap_units = np.floor(caps / step + 1e-9) if step > 0 else np.zeros(caps.shape)
+    units = np.arange(n_steps + 1)
+
+    # (units, tranche) batch, extra repayments as a share of each amount
+    params["annual_extra_repayment_rate"] = np.divide(
+        units[:, None] * step,
+        loan_total,
+        out=np.zeros((len(units), n_tranches)),
+        where=loan_total > 0,
+    )
+    total_interests, loan_balance = _amortize_totals(
+        *[params[k] for k in LOAN_PARAMETERS]
+    )
+    if objective == "total_interests":
+        values = total_interests
+    elif objective == "loan_balance":
+        values = loan_balance
+    else:
+        raise ValueError(f"Unknown objective: {objective}")
+    values = np.where(units[:, None] <= cap_units, values, np.inf)
+
+    # best[b]: smallest objective of the tranches so far with at most b
+    # units, choices[j, b]: the units of tranche j in it
+    best = np.zeros(len(units))
+    choices = np.zeros((n_tranches, len(units)), dtype=int)
+    spent = units[:, None] - units[None, :]
+    for j in range(n_tranches):
+        # (budget b, units u of tranche j), u <= b; the first minimum spends
+        # the fewest units of tranche j
+        candidates = np.where(
+            spent >= 0, best[np.maximum(spent, 0)] + values[:, j][None, :], np.inf
+        )
+        choices[j] = np.argmin(candidates, axis=-1)
+        best = candidates[units, choices[j]]
+
+    allocation = np.zeros(n_tranches, dtype=int)
+    remaining = n_steps
+    for j in reversed(range(n_tranches)):
+        allocation[j] = choices[j, remaining]
+        remaining -= allocation[j]
+    tranches = np.arange(n_tranches)
+    return (
+        allocation * step,
+        total_interests[allocation, tranches],
+        loan_balance[allocation, tranches],
+    )
+
+
+def get_roi_scenarios(
+    yearly_agg_summary,
+    property_value,
+    first_fee,
+    yearly_cold_rent,
+    n_years,
+    rent_increase_rate,
+    yearly_maintenance_cost,
+    yearly_property_tax,
+    surface,
+    property_appreciation_rate,
+):
+    # get_roi as arrays of shape (*scenarios, year): every parameter but the
+    # loan summary and n_years may be an array, and they are broadcast against
+    # each other (e.g. appreciation rates[:, None] x rent increase rates).
+    years = np.arange(1, n_years + 1)
+    interests = np.cumsum(yearly_agg_summary.loc[years, "interests"].to_numpy())
+    loan_balance = yearly_agg_summary.loc[years, "loan balance"].to_numpy()
+
+    def scenario(value):
+        return np.asarray(value, dtype=float)[..., None]
+
+    property_value = scenario(property_value)
+    property_appreciation_rate = scenario(property_appreciation_rate)
+
+    initial_share_value = property_value - loan_balance
+    new_share_value = (
+        initial_share_value * (1 + property_appreciation_rate) ** years
+    )  # exponential
+    diff_share_value = new_share_value - initial_share_value
+
+    rent = np.cumsum(
+        scenario(yearly_cold_rent) * (1 + scenario(rent_increase_rate)) ** (years - 1),
+        axis=-1,
+    )
+    extra_costs = years * scenario(yearly_maintenance_cost + yearly_property_tax)
+    networth = -scenario(first_fee) + diff_share_value + rent - interests - extra_costs
+
+    property_value_ = property_value * (
+        1 + property_appreciation_rate * years
+    )  # linear
+
+    columns = {
+        "year": years,
+        "amount invested": initial_share_value,
+        "property share": diff_share_value,
+        "interests": -interests,
+        "rent": rent,
+        "extra costs": -extra_costs,
+        "networth": networth,
+        "property": property_value_,
+        "m2 price": np.round(property_value_ / scenario(surface), 2),
+    }
+    return dict(zip(columns, np.broadcast_arrays(*columns.values())))
+
+
+@memoize(maxsize=64)
 def get_roi(
     yearly_agg_summary,
     property_value,
@@ -68,52 +895,185 @@ def get_roi(
     surface,
     property_appreciation_rate,
 ):
-    interests = 0
-    networth = -first_fee
-    rent = 0
-    property_share = 0
-    extra_costs = 0
-    property_value_ = property_value
-
-    info_dict = {
-        "year": [],
-        "amount invested": [],
-        "property share": [],
-        "interests": [],
-        "rent": [],
-        "extra costs": [],
-        "networth": [],
-        "property": [],
-        "m2 price": [],
+    roi = get_roi_scenarios(
+        yearly_agg_summary,
+        property_value,
+        first_fee,
+        yearly_cold_rent,
+        n_years,
+        rent_increase_rate,
+        yearly_maintenance_cost,
+        yearly_property_tax,
+        surface,
+        property_appreciation_rate,
+    )
+    if roi["year"].ndim == 1:
+        return pd.DataFrame(roi)
+
+    # one row per scenario and year, labelled by the scenario rates
+    shape = roi["year"].shape
+    scenarios = {
+        "property appreciation rate": np.broadcast_to(
+            np.asarray(property_appreciation_rate, dtype=float)[..., None], shape
+        ),
+        "rent increase rate": np.broadcast_to(
+            np.asarray(rent_increase_rate, dtype=float)[..., None], shape
+        ),
     }
+    return pd.DataFrame({k: v.ravel() for k, v in {**scenarios, **roi}.items()})
 
-    for y in range(1, n_years + 1):
-        info_dict["year"].append(y)
 
-        interests += yearly_agg_summary.loc[y, "interests"]
-        info_dict["interests"].append(-interests)
+def get_rent_vs_buy_scenarios(
+    loan_summary,
+    property_value,
+    initial_cash,
+    yearly_cold_rent,
+    rent_increase_rate,
+    yearly_maintenance_cost,
+    yearly_property_tax,
+    property_appreciation_rate,
+    market_return,
+):
+    # Buying with the loan of loan_summary (a get_loan_schedule or
+    # get_loan_summary result) against renting and investing, as arrays of
+    # shape (*scenarios, year): every parameter but the loan summary may be an
+    # array, broadcast against each other like in get_roi_scenarios.
+    # The renter invests the initial cash (downpayment and fees) at the market
+    # return; each year whoever has the cheaper housing invests the difference
+    # with the other one's costs (loan payments, maintenance and tax for the
+    # buyer, rent for the renter). The buyer also owns the appreciated
+    # property minus the loan balance.
+    years = np.arange(1, len(loan_summary) + 1)
 
-        initial_share_value = property_value - yearly_agg_summary.loc[y, "loan balance"]
-        new_share_value = (
-            initial_share_value * (1 + property_appreciation_rate) ** y
-        )  # exponential
-        # new_share_value = initial_share_value * (1 + property_appreciation_rate * y)  # linear
-        diff_share_value = new_share_value - initial_share_value
-        info_dict["property share"].append(diff_share_value)
-        info_dict["amount invested"].append(initial_share_value)
+    def column(name):
+        return np.asarray(loan_summary[name], dtype=float)
 
-        rent += yearly_cold_rent * (1 + rent_increase_rate) ** (y - 1)
-        info_dict["rent"].append(rent)
+    def scenario(value):
+        return np.asarray(value, dtype=float)[..., None]
 
-        extra_costs += yearly_maintenance_cost + yearly_property_tax
-        info_dict["extra costs"].append(-extra_costs)
+    loan_payments = (
+        column("annual_interests")
+        + column("annual_principal")
+        + column("extra repayment")
+    )
+    buy_costs = loan_payments + scenario(yearly_maintenance_cost + yearly_property_tax)
+    rent = scenario(yearly_cold_rent) * (1 + scenario(rent_increase_rate)) ** (
+        years - 1
+    )
 
-        networth = -first_fee + diff_share_value + rent - interests - extra_costs
-        info_dict["networth"].append(networth)
+    # both portfolios grow at the market return and receive the yearly savings
+    savings = buy_costs - rent
+    initial_cash = scenario(initial_cash)
+    growth, savings, initial_cash = np.broadcast_arrays(
+        1 + scenario(market_return), savings, initial_cash
+    )
+    rent_portfolio = _solve_linear_recurrence(
+        growth, np.maximum(savings, 0.0), initial_cash[..., 0]
+    )
+    buy_portfolio = _solve_linear_recurrence(
+        growth, np.maximum(-savings, 0.0), np.zeros(savings.shape[:-1])
+    )
+    property_value = (
+        scenario(property_value) * (1 + scenario(property_appreciation_rate)) ** years
+    )
+    buy_networth = property_value - column("loan balance") + buy_portfolio
 
-        property_value_ += property_value * property_appreciation_rate  # linear
-        # property_value_ *= (1 + property_appreciation_rate)**y  # exponential
-        info_dict["property"].append(property_value_)
-        info_dict["m2 price"].append(round(property_value_ / surface, 2))
+    columns = {
+        "year": years,
+        "rent": rent,
+        "buy costs": buy_costs,
+        "property": property_value,
+        "loan balance": column("loan balance"),
+        "rent networth": rent_portfolio,
+        "buy networth": buy_networth,
+        "difference": buy_networth - rent_portfolio,
+    }
+    return dict(zip(columns, np.broadcast_arrays(*columns.values())))
+
+
+def get_break_even_year(difference):
+    # First year from which buying stays ahead of renting for the rest of the
+    # horizon (difference as in get_rent_vs_buy_scenarios), NaN if never.
+    behind = difference < 0
+    n_years = difference.shape[-1]
+    last_behind = np.where(
+        behind.any(axis=-1), n_years - np.argmax(behind[..., ::-1], axis=-1), 0
+    )
+    return np.where(last_behind < n_years, last_behind + 1.0, np.nan)
+
+
+def get_property_loan_totals(
+    plot_value,
+    house_value,
+    extra_house_cost,
+    downpayment,
+    real_estate_rate,
+    property_transfer_tax_rate,
+    notary_rate,
+    n_years,
+    interest_rate,
+    monthly_payment,
+    annual_extra_repayment_rate=0,
+):
+    # get_loan_totals of the loan financing a property, from the inputs of
+    # the Real-estate view: the acquisition fees are rates of the plot value
+    loan_total = (
+        np.asarray(plot_value, dtype=float)
+        * (1 + real_estate_rate + property_transfer_tax_rate + notary_rate)
+        + house_value
+        + extra_house_cost
+        - downpayment
+    )
+    return _amortize_totals(
+        n_years,
+        loan_total,
+        interest_rate,
+        monthly_payment,
+        annual_extra_repayment_rate,
+        interests_only_period=0,
+        start_month=1,
+        free_period=0,
+    )
+
+
+def get_sensitivities(func, inputs, relative_step=0.1, integers=(), **params):
+    # One-at-a-time sensitivity of the outputs of a vectorized func: each of
+    # the k inputs is moved down and up by relative_step (the integers by at
+    # least 1) while the other params keep their value, and the 2 * k + 1
+    # scenarios, the unchanged one first, are evaluated in a single call.
+    # Returns the (input, down/up) values and outputs, the unchanged outputs
+    # and the arc elasticities (relative change of the output over relative
+    # change of the input), NaN for the inputs or outputs at 0.
+    base = np.array([params[name] for name in inputs], dtype=float)
+    step = np.abs(base) * relative_step
+    for n, name in enumerate(inputs):
+        if name in integers:
+            step[n] = max(round(step[n]), 1)
+    values = base[:, None] + step[:, None] * [-1, 1]
+
+    # (scenario,) arrays, scenario 1 + 2 * n + j moving input n down (j = 0)
+    # or up (j = 1)
+    n_scenarios = 1 + 2 * len(inputs)
+    scenarios = {
+        name: np.full(n_scenarios, value, dtype=float) for name, value in params.items()
+    }
+    for n, name in enumerate(inputs):
+        scenarios[name][1 + 2 * n : 3 + 2 * n] = values[n]
+    outputs = [np.asarray(output) for output in func(**scenarios)]
 
-    return pd.DataFrame(info_dict)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        relative_input = (values[:, 1] - values[:, 0]) / base
+        results = []
+        for output in outputs:
+            moved = output[1:].reshape(len(inputs), 2)
+            elasticity = (moved[:, 1] - moved[:, 0]) / output[0] / relative_input
+            results.append(
+                dict(
+                    base=output[0],
+                    values=moved,
+                    elasticity=np.where(
+                        np.isfinite(elasticity) & (step > 0), elasticity, np.nan
+                    ),
+                )
+            )
+    return values, results
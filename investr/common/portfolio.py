@@ -0,0 +1,175 @@
+import io
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import yaml
+
+from investr.common.cache import memoize
+
+# Mortgage configuration schema: a mapping (or list) of mortgages with the
+# amount, the interest rate in %, the number of years, the monthly payment
+# and an optional name, where "{}" is replaced by the mortgage position
+PORTFOLIO_FIELDS = ["amount", "interest", "n_years", "monthly"]
+DEFAULT_NAME = "Mortgage {}"
+MAX_N_YEARS = 40
+FORMATS = {".yml": "yaml", ".yaml": "yaml", ".json": "json", ".csv": "csv"}
+
+_YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+class PortfolioError(ValueError):
+    pass
+
+
+def _read_only(values):
+    values = np.array(values)
+    values.flags.writeable = False
+    return values
+
+
+class Portfolio:
+    # Mortgages of a configuration as columns, with the interest rate in %:
+    # loans() gives the parameters of the batched engine functions. The cached
+    # results of parse_portfolio are shared by every session, so the names
+    # and columns are read-only copies.
+    def __init__(self, names, amount, interest, n_years, monthly):
+        self.names = tuple(names)
+        self.amount = _read_only(amount)
+        self.interest = _read_only(interest)
+        self.n_years = _read_only(n_years)
+        self.monthly = _read_only(monthly)
+
+    def __len__(self):
+        return len(self.names)
+
+    def loans(self):
+        return dict(
+            n_years=self.n_years,
+            loan_total=self.amount,
+            interest_rate=self.interest / 100,
+            monthly_payment=self.monthly,
+        )
+
+
+def _read_entries(content, fmt):
+    # -> DataFrame with one row per mortgage and its label for the errors
+    if fmt == "csv":
+        try:
+            df = pd.read_csv(io.BytesIO(content), dtype={"name": str})
+        except (ValueError, pd.errors.ParserError) as e:
+            raise PortfolioError(f"Cannot parse the CSV file: {e}") from None
+        labels = [f"row {n + 2}" for n in range(len(df))]
+        return df, labels
+
+    try:
+        if fmt == "json":
+            data = json.loads(content)
+        else:
+            data = yaml.load(content, Loader=_YamlLoader)
+    except (ValueError, yaml.YAMLError) as e:
+        raise PortfolioError(f"Cannot parse the {fmt.upper()} file: {e}") from None
+
+    if isinstance(data, dict):
+        labels, entries = [f"'{key}'" for key in data], list(data.values())
+    elif isinstance(data, list):
+        labels, entries = [f"entry {n + 1}" for n in range(len(data))], data
+    else:
+        raise PortfolioError("Expected a mapping or a list of mortgages")
+    for label, entry in zip(labels, entries):
+        if not isinstance(entry, dict):
+            raise PortfolioError(f"Mortgage {label}: expected a mapping of fields")
+    return pd.DataFrame.from_records(entries), labels
+
+
+def _format_name(name, position):
+    try:
+        return name.format(position)
+    except (IndexError, KeyError, ValueError):
+        # other braces than "{}" are part of the name
+        return name
+
+
+@memoize(maxsize=16)
+def parse_portfolio(content, fmt):
+    # Validated Portfolio from the bytes of a configuration file; cached by
+    # content, so reruns with the same upload skip parsing and validation.
+    if fmt not in FORMATS.values():
+        raise PortfolioError(f"Unknown portfolio format: {fmt}")
+    df, labels = _read_entries(content, fmt)
+    if df.empty:
+        raise PortfolioError("The portfolio has no mortgages")
+
+    unknown = sorted(set(df.columns) - set(PORTFOLIO_FIELDS) - {"name"})
+    if unknown:
+        raise PortfolioError(
+            f"Unknown fields {unknown}, expected {PORTFOLIO_FIELDS} and name"
+        )
+    labels = np.array(labels)
+
+    columns = {}
+    for field in PORTFOLIO_FIELDS:
+        if field not in df:
+            raise PortfolioError(f"Missing field '{field}'")
+        missing = df[field].isna().to_numpy()
+        if missing.any():
+            raise PortfolioError(
+                f"Mortgage {labels[np.argmax(missing)]}: missing field '{field}'"
+            )
+        values = pd.to_numeric(df[field], errors="coerce").to_numpy(dtype=float)
+        invalid = ~np.isfinite(values)
+        if invalid.any():
+            n = np.argmax(invalid)
+            raise PortfolioError(
+                f"Mortgage {labels[n]}: '{field}' must be a number, "
+                f"got {df[field].iloc[n]!r}"
+            )
+        columns[field] = values
+
+    checks = [
+        ("amount", columns["amount"] >= 0, "must not be negative"),
+        ("interest", columns["interest"] >= 0, "must not be negative"),
+        ("monthly", columns["monthly"] >= 0, "must not be negative"),
+        (
+            "n_years",
+            (columns["n_years"] >= 1)
+            & (columns["n_years"] <= MAX_N_YEARS)
+            & (columns["n_years"] % 1 == 0),
+            f"must be a whole number of years between 1 and {MAX_N_YEARS}",
+        ),
+    ]
+    for field, valid, message in checks:
+        if not valid.all():
+            n = np.argmax(~valid)
+            raise PortfolioError(
+                f"Mortgage {labels[n]}: '{field}' {message}, got {columns[field][n]:g}"
+            )
+
+    names = df["name"] if "name" in df else pd.Series([None] * len(df))
+    names = [
+        _format_name(DEFAULT_NAME if pd.isna(name) else str(name), n + 1)
+        for n, name in enumerate(names)
+    ]
+    return Portfolio(
+        names,
+        columns["amount"],
+        columns["interest"],
+        columns["n_years"].astype(int),
+        columns["monthly"],
+    )
+
+
+def load_portfolio(source, name=None):
+    # source is a path or the bytes of an uploaded file, whose name gives the
+    # format
+    name = source if name is None else name
+    fmt = FORMATS.get(os.path.splitext(name)[1].lower())
+    if fmt is None:
+        raise PortfolioError(
+            f"Unsupported portfolio file {name}, expected one of {sorted(FORMATS)}"
+        )
+    if not isinstance(source, bytes):
+        with open(source, "rb") as f:
+            source = f.read()
+    return parse_portfolio(source, fmt)
@@ -0,0 +1,84 @@
+import numpy as np
+
+RATE_MODELS = ["vasicek", "cir"]
+
+
+def parse_rate_steps(text):
+    # Step schedule "year: rate %, year: rate %, ..." -> {first year: rate}
+    # with the rates as fractions, each rate applying from its year on
+    steps = {}
+    for item in text.replace(";", ",").split(","):
+        if not item.strip():
+            continue
+        try:
+            year, rate = item.split(":")
+            year, rate = int(year), float(rate) / 100
+        except ValueError:
+            raise ValueError(
+                f"Invalid rate step {item.strip()!r}, expected 'year: rate %'"
+            ) from None
+        if year < 1:
+            raise ValueError(f"Invalid rate step {item.strip()!r}, years start at 1")
+        steps[year] = rate
+    if not steps:
+        raise ValueError("The rate schedule has no steps")
+    return steps
+
+
+def step_rate_path(steps, n_years, initial_rate=None):
+    # (n_years,) yearly rates of a step schedule {first year: rate}; the years
+    # before the first step have initial_rate (the first rate by default)
+    years = sorted(steps)
+    rates = np.array([steps[year] for year in years], dtype=float)
+    initial_rate = rates[0] if initial_rate is None else initial_rate
+    n = np.searchsorted(years, np.arange(1, n_years + 1), side="right")
+    return np.where(n > 0, rates[np.maximum(n - 1, 0)], initial_rate)
+
+
+def simulate_rate_paths(
+    model,
+    r0,
+    mean,
+    speed,
+    volatility,
+    n_years,
+    n_paths,
+    seed=None,
+    steps_per_year=12,
+):
+    # Yearly interest rate paths of shape (n_paths, *shape of r0, n_years): the
+    # average over each year of the short rate of the Vasicek
+    # (dr = speed (mean - r) dt + volatility dW) or CIR (volatility sqrt(r) dW)
+    # model, simulated with steps_per_year steps. Every starting rate of r0
+    # follows the same shocks. Vasicek steps are exact; CIR uses an Euler
+    # scheme with full truncation, so its rates stay >= 0. Each step is
+    # vectorized over the paths and only the yearly averages are kept.
+    if model not in RATE_MODELS:
+        raise ValueError(f"Unknown rate model: {model}")
+    dt = 1 / steps_per_year
+    r0 = np.asarray(r0, dtype=float)
+    rng = np.random.default_rng(seed)
+
+    rates = np.zeros((int(n_years), n_paths) + r0.shape)
+    r = np.broadcast_to(r0, (n_paths,) + r0.shape)
+    decay = np.exp(-speed * dt)
+    if speed > 0:
+        scale = volatility * np.sqrt((1 - decay ** 2) / (2 * speed))
+    else:
+        scale = volatility * np.sqrt(dt)
+    for year in range(int(n_years)):
+        shocks = rng.standard_normal((steps_per_year, n_paths) + (1,) * r0.ndim)
+        for shock in shocks:
+            if model == "vasicek":
+                r = mean + (r - mean) * decay + scale * shock
+                rates[year] += r
+            else:
+                positive = np.maximum(r, 0.0)
+                r = (
+                    r
+                    + speed * (mean - positive) * dt
+                    + volatility * np.sqrt(positive * dt) * shock
+                )
+                rates[year] += np.maximum(r, 0.0)
+    rates /= steps_per_year
+    return np.moveaxis(rates, 0, -1)
@@ -0,0 +1,163 @@
+import hashlib
+import inspect
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from functools import wraps
+
+from investr.common.cache import CacheInfo, call_key, registry
+
+# SQLite file shared by the sessions and the processes of the app (an empty
+# INVESTR_STORE_PATH disables the store), and its size above which the least
+# recently used results are evicted
+STORE_PATH = os.environ.get(
+    "INVESTR_STORE_PATH",
+    os.path.join(os.path.expanduser("~"), ".cache", "investr", "results.sqlite"),
+)
+STORE_MAX_MB = float(os.environ.get("INVESTR_STORE_MAX_MB", 256))
+
+# failures of the store, after which results are computed as if it was empty
+STORE_ERRORS = (OSError, sqlite3.Error, pickle.PickleError)
+
+
+class ResultStore:
+    # Pickled results keyed by call_key hashes in a SQLite table. WAL mode
+    # lets several app processes read while one of them writes; every thread
+    # gets its own connection.
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0}
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                "size INTEGER NOT NULL, accessed REAL NOT NULL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)"
+            )
+            self._local.connection = connection
+        return connection
+
+    def _count(self, stat):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def get(self, key):
+        connection = self._connection()
+        row = connection.execute(
+            "SELECT value FROM results WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            self._count("misses")
+            raise KeyError(key)
+        connection.execute(
+            "UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key)
+        )
+        self._count("hits")
+        return pickle.loads(row[0])
+
+    def put(self, key, value):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(blob) > self.max_bytes:
+            return
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                (key, blob, len(blob), time.time()),
+            )
+            self._evict(connection)
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def _evict(self, connection):
+        (total,) = connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM results"
+        ).fetchone()
+        if total <= self.max_bytes:
+            return
+        evicted = []
+        for key, size in connection.execute(
+            "SELECT key, size FROM results ORDER BY accessed"
+        ):
+            evicted.append((key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+        connection.executemany("DELETE FROM results WHERE key = ?", evicted)
+
+    def cache_info(self):
+        try:
+            (count,) = (
+                self._connection().execute("SELECT COUNT(*) FROM results").fetchone()
+            )
+        except STORE_ERRORS:
+            count = 0
+        with self._lock:
+            return CacheInfo(
+                self._stats["hits"], self._stats["misses"], self.max_bytes, count
+            )
+
+    def cache_clear(self):
+        self._connection().execute("DELETE FROM results")
+        with self._lock:
+            self._stats.update(hits=0, misses=0)
+
+
+store = None
+if STORE_PATH:
+    store = ResultStore(STORE_PATH, int(STORE_MAX_MB * 2 ** 20))
+    registry[f"{__name__}.results"] = store
+
+_persisted = {}
+
+
+def source_version(func):
+    # hash of the source of func's module, part of the store keys so that
+    # results computed by another version of the code are not reused
+    with open(inspect.getsourcefile(inspect.unwrap(func)), "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def persisted(func):
+    # func reading its results from the store before computing them. Store
+    # errors (e.g. a read-only disk) fall back to computing.
+    if func in _persisted:
+        return _persisted[func]
+
+    key_of = call_key(func)
+    version = source_version(func)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if store is None:
+            return func(*args, **kwargs)
+        key = key_of(args, kwargs, func.__module__, version)
+        try:
+            return store.get(key)
+        except (KeyError, *STORE_ERRORS):
+            pass
+        result = func(*args, **kwargs)
+        try:
+            store.put(key, result)
+        except STORE_ERRORS:
+            pass
+        return result
+
+    _persisted[func] = wrapper
+    return wrapper
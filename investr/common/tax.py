@@ -0,0 +1,96 @@
+import numpy as np
+
+from investr.common.mortgage import LOAN_SUMMARY_COLUMNS
+
+RENTAL_COLUMNS = [
+    "rent",
+    "costs",
+    "interests",
+    "repayment",
+    "depreciation",
+    "taxable income",
+    "tax",
+    "cash flow",
+    "after-tax cash flow",
+]
+
+
+def get_depreciation(building_value, depreciation_rate, n_years):
+    # (..., year) straight-line depreciation of the building (the plot does
+    # not depreciate): depreciation_rate of the building value every year
+    # until the building value is written off
+    building_value = np.asarray(building_value, dtype=float)[..., None]
+    yearly = building_value * np.asarray(depreciation_rate, dtype=float)[..., None]
+    written_off = yearly * np.arange(n_years)
+    return np.clip(building_value - written_off, 0.0, yearly)
+
+
+def _loan_columns(loan_summary):
+    # yearly interests and repayments (principal and extra repayment) of a
+    # get_loan_schedule result or of a (..., year, column) summary array like
+    # the ones of get_loan_summaries
+    if loan_summary.dtype.names is not None:
+
+        def column(name):
+            return np.asarray(loan_summary[name], dtype=float)
+
+    else:
+
+        def column(name):
+            return loan_summary[..., LOAN_SUMMARY_COLUMNS.index(name)]
+
+    return (
+        column("annual_interests"),
+        column("annual_principal") + column("extra repayment"),
+    )
+
+
+def get_rental_cash_flows(
+    loan_summary,
+    building_value,
+    yearly_rent,
+    rent_increase_rate,
+    yearly_costs,
+    depreciation_rate,
+    marginal_tax_rate,
+):
+    # Yearly income tax and after-tax cash flow of a rental property financed
+    # by the loan of loan_summary, as arrays of shape (*scenarios, year): every
+    # parameter but the loan summary may be an array, broadcast against each
+    # other and against the leading (loan) axes of a batched summary.
+    # The taxable income is the rent minus the costs, the loan interests and
+    # the depreciation of the building; the repayments are not deductible.
+    # Losses are offset against the other income at the marginal tax rate,
+    # so a negative tax is a refund.
+    interests, repayment = _loan_columns(loan_summary)
+    n_years = interests.shape[-1]
+    years = np.arange(n_years)
+
+    def scenario(value):
+        return np.asarray(value, dtype=float)[..., None]
+
+    rent = scenario(yearly_rent) * (1 + scenario(rent_increase_rate)) ** years
+    costs = scenario(yearly_costs)
+    depreciation = get_depreciation(building_value, depreciation_rate, n_years)
+
+    taxable_income = rent - costs - interests - depreciation
+    tax = taxable_income * scenario(marginal_tax_rate)
+    cash_flow = rent - costs - interests - repayment
+
+    columns = dict(
+        zip(
+            RENTAL_COLUMNS,
+            [
+                rent,
+                costs,
+                interests,
+                repayment,
+                depreciation,
+                taxable_income,
+                tax,
+                cash_flow,
+                cash_flow - tax,
+            ],
+        )
+    )
+    return dict(zip(columns, np.broadcast_arrays(*columns.values())))
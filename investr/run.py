@@ -1,6 +1,11 @@
+import json
 import os
+import sys
+import time
 import streamlit as st
 
+script_start = time.perf_counter()
+
 st.set_page_config(
     page_title="Household Investment Simulator",
     layout="wide",
@@ -9,12 +14,55 @@ st.set_page_config(
 
 
 from investr.views.register import register as views_register
+from investr.views.register import current_timings, load_times, load_view
+
+registry_loaded = time.perf_counter()
 
 
 def cli():
     os.system("streamlit run simulation/run.py")
 
 
+def show_diagnostics(record, profile=None):
+    with st.expander("Diagnostics", expanded=False):
+        col_1, col_2 = st.columns(2)
+        with col_1:
+            timings = {**record["startup"], **record["phases"]}
+            st.table(
+                {
+                    "step": list(timings),
+                    "ms": [round(t * 1000, 1) for t in timings.values()],
+                }
+            )
+        with col_2:
+            if record.get("cache"):
+                st.table(
+                    {
+                        "function": list(record["cache"]),
+                        **{
+                            field: [info[field] for info in record["cache"].values()]
+                            for field in ["hits", "misses", "currsize"]
+                        },
+                    }
+                )
+        if record.get("charts"):
+            charts = {
+                "chart": list(record["charts"]),
+                "points": [c["rows"] for c in record["charts"].values()],
+            }
+            if profile:
+                charts["KB"] = [
+                    round(c["bytes"] / 1024, 1) for c in record["charts"].values()
+                ]
+            st.table(charts)
+        if profile:
+            st.text(profile)
+        st.code(
+            json.dumps(st.session_state.get("diagnostics", []), indent=2),
+            language="json",
+        )
+
+
 # query params
 views_names = list(views_register.keys())
 default_view = views_names[0]
@@ -37,4 +85,29 @@ selected_view = st.sidebar.selectbox(
 # else:
 #     selected_view = queried_view
 
-views_register[selected_view]()  # common_data
+profile = "profile" in query_params
+try:
+    was_loaded = selected_view in load_times
+    view = load_view(selected_view)
+    view(profile=profile)  # common_data
+finally:
+    view_import = 0.0 if was_loaded else load_times.get(selected_view, 0.0)
+    timings = current_timings()
+    if timings is not None and timings.view == selected_view:
+        record = timings.to_dict()
+        record["startup"] = {
+            "app and view registry import": registry_loaded - script_start,
+            "view module import": view_import,
+        }
+        record["total"] = time.perf_counter() - script_start
+        # only report the cache if a view already imported it
+        if "investr.common.cache" in sys.modules:
+            record["cache"] = {
+                name.rsplit(".", 1)[-1]: info._asdict()
+                for name, info in sys.modules["investr.common.cache"]
+                .cache_stats()
+                .items()
+            }
+        history = st.session_state.setdefault("diagnostics", [])
+        history[:] = (history + [record])[-20:]
+        show_diagnostics(record, timings.profile)
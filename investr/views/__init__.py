@@ -1,6 +1,13 @@
-# from .template import show_template
-from .regular import show_regular
-from .realestate import show_realestate
-from .combined_mortgages import show_combined_mortages
+from investr.views.register import declare_lazy_view
 
-# from .cagr import show_cagr
+# View modules (and the libraries they use) are only imported once the view is
+# selected, see register.load_view.
+
+# declare_lazy_view("template", "investr.views.template")
+declare_lazy_view("Value growth", "investr.views.regular")
+declare_lazy_view("Real-estate", "investr.views.realestate")
+declare_lazy_view("Combined mortgages", "investr.views.combined_mortgages")
+declare_lazy_view("Mortgage sweep", "investr.views.sweep")
+declare_lazy_view("Rental property", "investr.views.combined_mortgages_depr")
+
+# declare_lazy_view("CAGR", "investr.views.cagr")
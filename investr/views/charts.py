@@ -0,0 +1,139 @@
+import os
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from investr.views.register import current_timings
+
+# Largest number of data points sent to the browser for a single chart
+MAX_POINTS = int(os.environ.get("INVESTR_CHART_MAX_POINTS", 1000))
+
+
+def lttb(x, y, n_out):
+    # Largest-Triangle-Three-Buckets: indices of n_out points of the (x, y)
+    # line keeping its visual shape. The first and last points are kept and
+    # every bucket in between keeps the point forming the largest triangle
+    # with the previously kept point and the average of the next bucket.
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    selected = np.empty(n_out, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = (
+            (edges[i + 1], edges[i + 2]) if i + 2 < len(edges) else (n - 1, n)
+        )
+        next_x = x[next_start:next_end].mean()
+        next_y = y[next_start:next_end].mean()
+        area = np.abs(
+            (x[a] - next_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (next_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def downsample_lines(df, x, y, by=None, max_points=MAX_POINTS):
+    # Long-format lines reduced with LTTB to max_points rows in total, shared
+    # between the series of the by column. Non numeric x (e.g. month labels)
+    # are taken in their order.
+    groups = [df] if by is None else [group for _, group in df.groupby(by, sort=False)]
+    n_out = max(max_points // len(groups), 3)
+    if all(len(group) <= n_out for group in groups):
+        return df
+
+    def positions(values):
+        if pd.api.types.is_numeric_dtype(values):
+            return values.to_numpy()
+        return np.arange(len(values))
+
+    return pd.concat(
+        [
+            group.iloc[lttb(positions(group[x]), group[y].to_numpy(), n_out)]
+            for group in groups
+        ],
+        ignore_index=True,
+    )
+
+
+def bucket_bars(df, x, y, by=None, max_points=MAX_POINTS, bucket=None):
+    # Long-format bars averaged per bucket: bucket gives the bucket of each
+    # row (e.g. the year of a monthly schedule), by default consecutive x
+    # values are grouped so that there are at most max_points bars, each
+    # bucket labelled by its first x value.
+    if bucket is None:
+        if len(df) <= max_points:
+            return df
+        values = pd.unique(df[x])
+        n_buckets = max(max_points * len(values) // len(df), 1)
+        buckets = np.arange(len(values)) * n_buckets // len(values)
+        labels = values[np.searchsorted(buckets, buckets)]
+        bucket = df[x].map(dict(zip(values, labels)))
+    keys = ([df[by]] if by is not None else []) + [bucket.rename(x)]
+    return df.groupby(keys, sort=False)[y].mean().reset_index()
+
+
+def bucket_grid(*grids, max_points=MAX_POINTS):
+    # (row, column) grids averaged over blocks of consecutive cells so that
+    # there are at most max_points cells, with the index of the first row and
+    # column of each block to label it. A block with a NaN cell is NaN.
+    shape = grids[0].shape
+    n_out = max(int(np.sqrt(max_points)), 1)
+    starts = []
+    for size in shape:
+        buckets = np.arange(size) * min(n_out, size) // size
+        starts.append(np.searchsorted(buckets, np.arange(min(n_out, size))))
+    counts = [np.diff(np.append(start, size)) for start, size in zip(starts, shape)]
+    averaged = [
+        np.add.reduceat(np.add.reduceat(grid, starts[0], axis=0), starts[1], axis=1)
+        / np.outer(*counts)
+        for grid in grids
+    ]
+    return starts[0], starts[1], averaged
+
+
+def round_columns(df, decimals=0, columns=None):
+    # Vectorized rounding of the numeric columns, less bytes to serialize
+    columns = df.select_dtypes("number").columns if columns is None else columns
+    df = df.copy()
+    df[columns] = df[columns].to_numpy().round(decimals)
+    return df
+
+
+def _chart_data(chart):
+    charts = [chart]
+    for attr in ["layer", "hconcat", "vconcat", "concat"]:
+        for sub_chart in getattr(chart, attr, None) or []:
+            charts.extend(_chart_data(sub_chart))
+    return charts
+
+
+def show_chart(chart, name=None, **kwargs):
+    # st.altair_chart recording the rows of the chart data in the diagnostics,
+    # and their JSON size when the view is profiled (data shared between
+    # layers is only counted once)
+    data = {}
+    for sub_chart in _chart_data(chart):
+        if isinstance(getattr(sub_chart, "data", None), pd.DataFrame):
+            data[id(sub_chart.data)] = sub_chart.data
+    timings = current_timings()
+    if timings is not None:
+        charts = timings.extra.setdefault("charts", {})
+        record = charts[name or f"chart {len(charts) + 1}"] = {
+            "rows": sum(len(df) for df in data.values()),
+        }
+        # serializing the data again is as slow as sending it, only when
+        # profiling
+        if timings.detailed:
+            record["bytes"] = sum(
+                len(df.to_json(orient="records")) for df in data.values()
+            )
+    return st.altair_chart(chart, **kwargs)
@@ -1,13 +1,39 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
 import altair as alt
 
-from investr.common.mortgage import get_loan_summary
-from investr.views.register import declare_view
+from investr.common.cache import make_key
+from investr.common.growth import PERCENTILES
+from investr.common.mortgage import (
+    LOAN_SUMMARY_COLUMNS,
+    MAX_OPTIMIZED_TRANCHES,
+    aggregate_loan_summaries,
+    get_loan_summaries,
+    get_loan_totals,
+    get_refinancing_tree,
+    get_variable_rate_totals,
+    optimize_extra_repayments,
+    solve_loan,
+)
+from investr.common.portfolio import (
+    DEFAULT_NAME,
+    Portfolio,
+    PortfolioError,
+    load_portfolio,
+)
+from investr.common.rates import parse_rate_steps, simulate_rate_paths, step_rate_path
+from investr.common.store import persisted
+from investr.views.charts import bucket_bars, round_columns, show_chart
+from investr.views.register import declare_view, phase
 from box import Box
 from itertools import cycle
 
 
+# inputs of a manually specified mortgage
+DEFAULT_MORTGAGE = dict(amount=500_000, interest=1.00, n_years=10, monthly=2000)
+
+
 def make_section_property(sidebar, name=""):
     with st.sidebar.expander(name + "Property", False):
         sidebar.plot_value = st.number_input(
@@ -75,23 +101,20 @@ def make_section_mortgage(sidebar, amount, interest, n_years, monthly, name=""):
     with st.sidebar.expander(f"{name}", False):
         sidebar[name] = {}
         sidebar[name].loan_total = st.number_input(
-            "Amount", value=amount, min_value=0, key=name + "amount"
+            "Amount", value=amount, min_value=type(amount)(0), key=name + "amount"
         )
-        sidebar[name].interest_rate = (
-            st.number_input(
-                "Interest rate %",
-                value=interest,
-                format="%.2f",
-                step=0.01,
-                key=name + "interest",
-            )
-            / 100
+        sidebar[name].interest = st.number_input(
+            "Interest rate %",
+            value=interest,
+            format="%.2f",
+            step=0.01,
+            key=name + "interest",
         )
         sidebar[name].n_years = st.number_input(
             "Number of years",
             value=n_years,
             step=5,
-            min_value=5,
+            min_value=1,
             max_value=40,
             key=name + "nyears",
         )
@@ -157,11 +180,339 @@ def print_summary(sidebar):
             )
 
 
+def show_goal_seek(loans, mortgage_names, **kwargs):
+    col_1, col_2, col_3 = st.columns(3)
+    with col_1:
+        solve_for = {
+            "Monthly payment": "monthly_payment",
+            "Number of years": "n_years",
+            "Annual extra repayment rate": "annual_extra_repayment_rate",
+        }[
+            st.selectbox(
+                "Solve for",
+                [
+                    "Monthly payment",
+                    "Number of years",
+                    "Annual extra repayment rate",
+                ],
+            )
+        ]
+    with col_2:
+        target = st.selectbox("Target", ["Residual balance", "Maximum total interests"])
+    with col_3:
+        target_value = st.number_input(f"{target} per mortgage", value=0, step=1000)
+
+    if target == "Residual balance":
+        solved = persisted(solve_loan)(
+            solve_for, target_balance=target_value, **loans, **kwargs
+        )
+    else:
+        solved = persisted(solve_loan)(
+            solve_for, max_total_interests=target_value, **loans, **kwargs
+        )
+
+    st.dataframe(
+        pd.DataFrame(
+            {"current": loans.get(solve_for, 0.0), "required": solved},
+            index=mortgage_names,
+        ).style.format(
+            "{:,.4f}" if solve_for == "annual_extra_repayment_rate" else "{:,.0f}",
+            na_rep="unreachable",
+        )
+    )
+
+
+def show_extra_repayment_optimizer(loans, mortgage_names, **kwargs):
+    col_1, col_2, col_3 = st.columns(3)
+    with col_1:
+        budget = st.number_input(
+            "Yearly extra repayment budget", value=10_000, min_value=0, step=1_000
+        )
+    with col_2:
+        cap_rate = (
+            st.number_input(
+                "Cap per mortgage (% of amount)",
+                value=5.0,
+                min_value=0.0,
+                format="%.1f",
+                step=0.5,
+            )
+            / 100
+        )
+    with col_3:
+        objective = {
+            "Total paid interests": "total_interests",
+            "Residual balance": "loan_balance",
+        }[st.selectbox("Minimize", ["Total paid interests", "Residual balance"])]
+
+    if len(mortgage_names) > MAX_OPTIMIZED_TRANCHES:
+        st.warning(f"The optimizer handles up to {MAX_OPTIMIZED_TRANCHES} mortgages.")
+        return
+
+    # only run on demand, the last result is kept while the inputs are the same
+    inputs = make_key(budget, cap_rate, objective, loans, kwargs)
+    if st.button("Optimize"):
+        st.session_state["extra repayment optimizer"] = (
+            inputs,
+            persisted(optimize_extra_repayments)(
+                budget,
+                caps=cap_rate * loans["loan_total"],
+                objective=objective,
+                **loans,
+                **kwargs,
+            ),
+        )
+    last_inputs, result = st.session_state.get(
+        "extra repayment optimizer", (None, None)
+    )
+    if last_inputs != inputs:
+        return
+
+    allocation, total_interests, loan_balance = result
+    current_interests, current_balance = persisted(get_loan_totals)(**loans, **kwargs)
+
+    df = pd.DataFrame(
+        {
+            "yearly extra repayment": allocation,
+            "total interests": total_interests,
+            "saved interests": current_interests - total_interests,
+            "loan balance": loan_balance,
+        },
+        index=mortgage_names,
+    )
+    df.loc["total"] = df.sum()
+    st.dataframe(df.style.format("{:,.0f}"))
+
+
+def show_refinancing_tree(loans, mortgage_names, **kwargs):
+    col_1, col_2 = st.columns(2)
+    with col_1:
+        n_refinancings = st.number_input(
+            "Refinancing points", value=2, min_value=1, max_value=5
+        )
+    with col_2:
+        n_branches = st.number_input(
+            "Rate branches per refinancing", value=3, min_value=1, max_value=5
+        )
+
+    default_branches = cycle([(2.0, 10, 25.0), (3.5, 10, 50.0), (5.0, 10, 25.0)])
+    branches = []
+    for n in range(int(n_branches)):
+        rate, years, probability = next(default_branches)
+        col_1, col_2, col_3 = st.columns(3)
+        with col_1:
+            rate = st.number_input(
+                f"Branch #{n + 1} rate %", value=rate, format="%.2f", step=0.25
+            )
+        with col_2:
+            years = st.number_input(
+                f"Branch #{n + 1} number of years", value=years, min_value=1
+            )
+        with col_3:
+            probability = st.number_input(
+                f"Branch #{n + 1} probability %",
+                value=probability,
+                min_value=0.0,
+                step=5.0,
+            )
+        branches.append((rate / 100, years, probability))
+    rates, years, probabilities = map(np.array, zip(*branches))
+    if probabilities.sum() <= 0:
+        st.error("At least one branch needs a positive probability.")
+        return
+
+    phase("computation")
+    # all the mortgages and leaves of the tree in one level-by-level pass
+    tree = persisted(get_refinancing_tree)(
+        follow_up_rates=rates,
+        follow_up_years=years,
+        n_refinancings=int(n_refinancings),
+        probabilities=probabilities,
+        **loans,
+        **kwargs,
+    )
+    fixed_interests, _ = persisted(get_loan_totals)(**loans, **kwargs)
+
+    phase("table render")
+    lifetime_interests = tree["total interests"]
+    worst = np.argmax(lifetime_interests, axis=-1)
+    df = pd.DataFrame(
+        {
+            "fixed-rate interests": fixed_interests,
+            "expected lifetime interests": lifetime_interests @ tree["probability"],
+            "worst-case lifetime interests": lifetime_interests.max(axis=-1),
+            "expected final balance": tree["loan balance"] @ tree["probability"],
+            "worst-case final balance": tree["loan balance"].max(axis=-1),
+        },
+        index=mortgage_names,
+    )
+    df.loc["total"] = df.sum()
+    worst_rates = [
+        " → ".join(f"{rates[b] * 100:.2f}%" for b in tree["branches"][n]) for n in worst
+    ]
+
+    st.markdown(
+        f"**{lifetime_interests.shape[-1]:,}** scenarios per mortgage. "
+        "Each mortgage is refinanced independently: the totals add up the "
+        "expected and worst cases of the mortgages."
+    )
+    st.dataframe(df.style.format("{:,.0f}"), width=1500)
+    st.dataframe(
+        pd.DataFrame({"worst-case follow-up rates": worst_rates}, index=mortgage_names),
+        width=1500,
+    )
+
+
+def show_rate_stress_test(loans, mortgage_names, **kwargs):
+    col_1, col_2 = st.columns(2)
+    with col_1:
+        floating = st.multiselect(
+            "Variable-rate mortgages", mortgage_names, mortgage_names[:1]
+        )
+    with col_2:
+        model = st.radio("Rate paths", ["Step schedule", "Vasicek", "CIR"])
+    if not floating:
+        st.info("Select the mortgages with a variable rate.")
+        return
+
+    is_floating = np.isin(mortgage_names, floating)
+    n_years = int(loans["n_years"][is_floating].max())
+
+    if model == "Step schedule":
+        text = st.text_input(
+            "Rate steps (year: rate %, ...)", "1: 1.0, 5: 3.0, 10: 4.5"
+        )
+        try:
+            steps = parse_rate_steps(text)
+        except ValueError as e:
+            st.error(str(e))
+            return
+        # the schedule replaces the rate of every variable-rate mortgage
+        rate_paths = step_rate_path(steps, n_years)[None, None, :]
+    else:
+        col_1, col_2, col_3, col_4, col_5 = st.columns(5)
+        with col_1:
+            mean = (
+                st.number_input("Long-term rate %", value=3.0, format="%.2f", step=0.25)
+                / 100
+            )
+        with col_2:
+            speed = st.number_input(
+                "Mean reversion speed", value=0.2, min_value=0.0, step=0.05
+            )
+        with col_3:
+            volatility = (
+                st.number_input(
+                    "Volatility %",
+                    value=1.0 if model == "Vasicek" else 5.0,
+                    min_value=0.0,
+                    format="%.2f",
+                    step=0.1,
+                    help="Of the rate (Vasicek) or of its square root (CIR)",
+                )
+                / 100
+            )
+        with col_4:
+            n_paths = st.number_input(
+                "Number of paths",
+                value=5_000,
+                min_value=100,
+                max_value=50_000,
+                step=1_000,
+            )
+        with col_5:
+            seed = st.number_input("Seed", value=0, min_value=0, step=1)
+
+    phase("computation")
+    if model != "Step schedule":
+        # the same shocks for every variable-rate mortgage, each path starting
+        # from the current rate of the mortgage
+        rate_paths = persisted(simulate_rate_paths)(
+            model.lower(),
+            loans["interest_rate"][is_floating],
+            mean,
+            speed,
+            volatility,
+            n_years,
+            int(n_paths),
+            seed,
+        )
+    # (path, variable-rate mortgage) totals in a single batched call, added to
+    # the totals of the fixed-rate mortgages
+    fixed = {name: values[~is_floating] for name, values in loans.items()}
+    floating_loans = {
+        name: values[is_floating]
+        for name, values in loans.items()
+        if name != "interest_rate"
+    }
+    fixed_interests, fixed_balance = get_loan_totals(**fixed, **kwargs)
+    total_interests, loan_balance = get_variable_rate_totals(
+        rate_paths=rate_paths, **floating_loans, **kwargs
+    )
+    current_interests, current_balance = get_loan_totals(**loans, **kwargs)
+    outcomes = {
+        "total interests": total_interests.sum(axis=1) + fixed_interests.sum(),
+        "loan balance": loan_balance.sum(axis=1) + fixed_balance.sum(),
+    }
+
+    phase("table render")
+    df = pd.DataFrame(
+        {name: np.percentile(values, PERCENTILES) for name, values in outcomes.items()},
+        index=pd.Index([f"p{p}" for p in PERCENTILES], name="percentile"),
+    )
+    df.loc["current rates"] = [current_interests.sum(), current_balance.sum()]
+    st.markdown(
+        f"All mortgages over **{len(rate_paths):,}** rate path(s): "
+        f"median total paid interests **{round(df['total interests']['p50']):,}** € "
+        f"and residual balance **{round(df['loan balance']['p50']):,}** €."
+    )
+    st.dataframe(df.style.format("{:,.0f}"))
+
+    phase("chart build")
+    years = np.arange(1, n_years + 1)
+    bands = np.percentile(rate_paths[:, 0] * 100, PERCENTILES, axis=0)
+    df_rates = pd.DataFrame(
+        bands.T.round(3), columns=[f"p{p}" for p in PERCENTILES]
+    ).assign(year=years)
+    base = alt.Chart(df_rates).encode(x=alt.X("year:O"))
+    counts, edges = np.histogram(outcomes["total interests"], bins=40)
+    show_chart(
+        alt.hconcat(
+            alt.layer(
+                base.mark_area(opacity=0.2).encode(
+                    y=alt.Y("p5:Q", title="interest rate %"), y2="p95:Q"
+                ),
+                base.mark_area(opacity=0.4).encode(y="p25:Q", y2="p75:Q"),
+                base.mark_line().encode(y="p50:Q"),
+            ).properties(title=f"Rate paths of {floating[0]}", width=400, height=250),
+            alt.Chart(
+                pd.DataFrame(
+                    {
+                        "start": edges[:-1].round(),
+                        "end": edges[1:].round(),
+                        "paths": counts,
+                    }
+                )
+            )
+            .mark_bar()
+            .encode(
+                x=alt.X("start:Q", bin="binned", title="total paid interests"),
+                x2="end:Q",
+                y="paths:Q",
+            )
+            .properties(title="Total paid interests", width=400, height=250),
+        )
+        .configure_axis(grid=False)
+        .configure_view(strokeWidth=0),
+        name="rate stress test",
+        use_container_width=True,
+    )
+
+
 @declare_view("Combined mortgages")
 def show_combined_mortages(*args, **kwargs):
 
     sidebar = Box()
-    data = []
 
     with st.sidebar.expander("Basic inputs", expanded=True):
         interests_only_period = st.number_input(
@@ -177,90 +528,76 @@ def show_combined_mortages(*args, **kwargs):
         start_month = st.number_input(
             "Starting month", min_value=1, max_value=12, value=9, step=0
         )
+        resolution = st.radio("Schedule resolution", ["yearly", "monthly"])
 
         mortgage_config = st.file_uploader(
-            "Upload a mortgage configuration", ["yml", "yaml"]
+            "Upload a mortgage configuration", ["yml", "yaml", "json", "csv"]
         )
 
-        default_mortgage_data = [
-            dict(
-                amount=500_000,
-                interest=1.00,
-                n_years=10,
-                monthly=2000,
-                name="Mortgage {}",
-            )
-        ]
-
+        portfolio = None
         if mortgage_config is not None:
             try:
-                loaded_configuration = Box.from_yaml(mortgage_config)
-                loaded_configuration = list(loaded_configuration.values())
-            except:
-                pass
-            else:
-                default_mortgage_data = loaded_configuration
-
-    with st.sidebar.expander("Manual specification", expanded=True):
-        n_mortgages = int(
-            st.number_input(
-                "Number of mortgages", min_value=1, value=len(default_mortgage_data)
-            )
+                portfolio = load_portfolio(
+                    mortgage_config.getvalue(), mortgage_config.name
+                )
+            except PortfolioError as e:
+                st.error(f"Invalid mortgage configuration: {e}")
+
+    if portfolio is not None:
+        # the columns of the file go straight to the engine, without widgets
+        # per mortgage: edit the file to change them
+        st.sidebar.info(
+            f"**{len(portfolio):,}** mortgages loaded from {mortgage_config.name}."
         )
-        default_mortgage_names = cycle([m["name"] for m in default_mortgage_data])
-        max_n_years = max([m["n_years"] for m in default_mortgage_data])
-
-        default_mortgage_data = cycle(default_mortgage_data)
-
-        mortgage_names = []
-        for n in range(n_mortgages):
-            mortgage_name = next(default_mortgage_names)
-            mortgage_name = mortgage_name.format(n + 1)
-            mortgage_names.append(
+    else:
+        with st.sidebar.expander("Manual specification", expanded=True):
+            n_mortgages = int(
+                st.number_input("Number of mortgages", min_value=1, value=1)
+            )
+            mortgage_names = [
                 st.text_input(
-                    f"Mortgage #{n + 1} name",
-                    value=mortgage_name,
+                    f"Mortgage #{n + 1} name", value=DEFAULT_NAME.format(n + 1)
                 )
-            )
-
-    for n in range(n_mortgages):
-        mortgage_data = next(default_mortgage_data)
-        mortgage_data = mortgage_data.copy()
-        _ = mortgage_data.pop("name").format(n + 1)
-        sidebar = make_section_mortgage(
-            sidebar, name=mortgage_names[n], **mortgage_data
+                for n in range(n_mortgages)
+            ]
+
+        for name in mortgage_names:
+            sidebar = make_section_mortgage(sidebar, name=name, **DEFAULT_MORTGAGE)
+        mortgages = [sidebar[name] for name in mortgage_names]
+        portfolio = Portfolio(
+            mortgage_names,
+            np.array([m.loan_total for m in mortgages], dtype=float),
+            np.array([m.interest for m in mortgages], dtype=float),
+            np.array([m.n_years for m in mortgages]),
+            np.array([m.monthly_payment for m in mortgages], dtype=float),
         )
 
-        df = get_loan_summary(
-            start_month=start_month,
-            interests_only_period=interests_only_period,
-            free_period=free_period,
-            **sidebar[mortgage_names[n]],
-        )
-
-        df = df[["monthly_interests", "monthly_principal", "loan balance"]]
-        df.rename(
-            columns={
-                "monthly_interests": f"interests",
-                "monthly_principal": f"principal",
-                "loan balance": f"balance",
-            },
-            inplace=True,
-        )
-        df.columns = pd.MultiIndex.from_product([df.columns, [mortgage_names[n]]])
-        data.append(df)
-
-    df = data[0]
-    if len(data) > 1:
-        for i in range(1, len(data)):
-            df = df.join(data[i], how="outer")
-
-    df["balance"] = df["balance"].fillna(method="pad")
-    df.fillna(value=0.0, inplace=True)
-
-    df["interests", "total"] = df[["interests"]].groupby(level=0, axis=1).sum()
-    df["principal", "total"] = df[["principal"]].groupby(level=0, axis=1).sum()
-    df["balance", "total"] = df[["balance"]].groupby(level=0, axis=1).sum()
+    phase("computation")
+    mortgage_names = list(portfolio.names)
+    loans = portfolio.loans()
+    summaries = persisted(get_loan_summaries)(
+        **loans,
+        start_month=start_month,
+        interests_only_period=interests_only_period,
+        free_period=free_period,
+        resolution=resolution,
+    )
+    max_n_years = summaries.shape[1]
+
+    # (metric, mortgage + total, year), only turned into a DataFrame for display
+    metrics = {
+        "interests": "monthly_interests",
+        "principal": "monthly_principal",
+        "balance": "loan balance",
+    }
+    aggregated = aggregate_loan_summaries(
+        summaries[..., [LOAN_SUMMARY_COLUMNS.index(c) for c in metrics.values()]]
+    )
+    df = pd.DataFrame(
+        aggregated.transpose(2, 0, 1).reshape(max_n_years, -1),
+        index=pd.RangeIndex(1, max_n_years + 1, name="year"),
+        columns=pd.MultiIndex.from_product([list(metrics), mortgage_names + ["total"]]),
+    )
 
     st.markdown(
         f"""
@@ -269,6 +606,7 @@ def show_combined_mortages(*args, **kwargs):
         Total paid interests: **{round(df['interests', 'total'].sum() * 12):,}** €
         """
     )
+    phase("table render")
     with st.expander("Show table", expanded=True):
         st.dataframe(
             df[["principal", "interests", "balance"]].style.format("{:,.0f}"),
@@ -278,6 +616,43 @@ def show_combined_mortages(*args, **kwargs):
     # st.write(df[["interests", "principal"]])
     # st.stop()
 
+    with st.expander("Goal seek", expanded=False):
+        show_goal_seek(
+            loans,
+            mortgage_names,
+            start_month=start_month,
+            interests_only_period=interests_only_period,
+            free_period=free_period,
+        )
+
+    with st.expander("Extra repayment optimizer", expanded=False):
+        show_extra_repayment_optimizer(
+            loans,
+            mortgage_names,
+            start_month=start_month,
+            interests_only_period=interests_only_period,
+            free_period=free_period,
+        )
+
+    with st.expander("Refinancing scenarios", expanded=False):
+        show_refinancing_tree(
+            loans,
+            mortgage_names,
+            start_month=start_month,
+            interests_only_period=interests_only_period,
+            free_period=free_period,
+        )
+
+    with st.expander("Variable-rate stress test", expanded=False):
+        show_rate_stress_test(
+            loans,
+            mortgage_names,
+            start_month=start_month,
+            interests_only_period=interests_only_period,
+            free_period=free_period,
+        )
+
+    phase("chart build")
     df_plot = df[["interests", "principal"]].drop("total", axis=1, level=1)
 
     if st.checkbox("Breakdown data"):
@@ -287,9 +662,12 @@ def show_combined_mortages(*args, **kwargs):
         ["year"], var_name="repayment type", value_name="monthly amount"
     )
 
-    df_melt["monthly amount"] = df_melt["monthly amount"].apply(round)
+    df_melt = round_columns(
+        bucket_bars(df_melt, "year", "monthly amount", by="repayment type"),
+        columns=["monthly amount"],
+    )
 
-    st.altair_chart(
+    show_chart(
         alt.Chart(df_melt)
         .mark_bar(cornerRadiusTopLeft=0, cornerRadiusTopRight=0)
         .transform_calculate(amount="datum['monthly amount'] + ' €'")
@@ -303,5 +681,6 @@ def show_combined_mortages(*args, **kwargs):
         .properties(width=800, height=400)
         .configure_axis(grid=False)
         .configure_view(strokeWidth=0),
+        name="repayments",
         use_container_width=True,
     )
@@ -1,9 +1,12 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
 import altair as alt
 
-from investr.common.mortgage import get_loan_summary
-from investr.views.register import declare_view
+from investr.common.mortgage import get_loan_schedule
+from investr.common.tax import RENTAL_COLUMNS, get_rental_cash_flows
+from investr.views.charts import downsample_lines, round_columns, show_chart
+from investr.views.register import declare_view, phase
 from box import Box
 
 
@@ -70,259 +73,177 @@ def make_section_acquisition_cost(sidebar, prefix=""):
         return sidebar
 
 
-def make_section_mortgage(sidebar, amount, interest, n_years, monthly, prefix=""):
-    with st.sidebar.expander(f"({prefix}) Mortgage", True):
-        sidebar[prefix] = {}
-        sidebar[prefix].loan_total = st.number_input(
-            "Amount", value=amount, min_value=0, key=prefix + "amount"
+def make_section_mortgage(sidebar, prefix=""):
+    with st.sidebar.expander(prefix + "Mortgage", True):
+        sidebar.interest_rate = (
+            st.number_input("Interest rate %", value=1.35, format="%.2f", step=0.01)
+            / 100
+        )
+        sidebar.n_years = st.number_input(
+            "Number of years", value=20, step=5, min_value=10, max_value=40
         )
-        sidebar[prefix].interest_rate = (
+        sidebar.monthly_payment = st.number_input(
+            "Monthly payment", value=2600, step=100, min_value=100, max_value=5000
+        )
+        sidebar.annual_extra_repayment_rate = (
             st.number_input(
-                "Interest rate %",
-                value=interest,
-                format="%.2f",
-                step=0.01,
-                key=prefix + "interest",
+                "Annual extra repayment %", value=0.0, format="%.1f", step=0.1
             )
             / 100
         )
-        sidebar[prefix].n_years = st.number_input(
-            "Number of years",
-            value=n_years,
-            step=5,
-            min_value=10,
-            max_value=40,
-            key=prefix + "nyears",
-        )
-        sidebar[prefix].monthly_payment = st.number_input(
-            "Monthly payment",
-            value=monthly,
-            key=prefix + "monthly",
-        )
-
     return sidebar
 
 
-def print_summary(sidebar):
-    with st.expander("Summary", True):
-        col_1, col_2, col_3 = st.columns(3)
-        with col_1:
-
-            loan_to_value = (
-                round(
-                    (
-                        sidebar.property_value
-                        - sidebar.downpayment
-                        + sidebar.extra_fees_total
-                    )
-                    / sidebar.property_value,
-                    2,
-                )
-                * 100
-            )
-
-            st.markdown(
-                f"""
-                    Total price: **{round(sidebar.property_value + sidebar.extra_fees_total):,}** €
-
-                    - Price/m\u00b2 (living space): **{round(sidebar.property_value / sidebar.usable_space):,}** €
-                    - Price/m\u00b2 (total): **{round(sidebar.property_value / sidebar.plot_surface):,}** €
-
-
-                    Downpayment: **{round(sidebar.downpayment):,}** €
-
-                    Low-to-value ratio: **{loan_to_value}** %
-                """
+def make_section_rental(sidebar, prefix=""):
+    with st.sidebar.expander(prefix + "Rental", True):
+        sidebar.yearly_rent = (
+            st.number_input("Monthly cold rent", value=3000, step=50) * 12
+        )
+        sidebar.rent_increase_rate = (
+            st.number_input(
+                "Rent yearly increase rate %", value=2.0, format="%.1f", step=0.5
             )
-        with col_2:
-            st.markdown(
-                f"""
-                    Acquisition cost: **{round(sidebar.extra_fees_total):,}** €
+            / 100
+        )
+        sidebar.yearly_costs = st.number_input(
+            "Yearly non-recoverable costs", value=3_000, step=100
+        )
 
-                    - Real-estate fees: **{round(sidebar.plot_value * sidebar.real_estate_rate):,}** €
-                    - Tax transfer fees: **{round(sidebar.plot_value * sidebar.property_transfer_tax_rate):,}** €
-                    - Notary fees: **{round(sidebar.plot_value * sidebar.notary_rate):,}** €
-                """
+    with st.sidebar.expander(prefix + "Tax", True):
+        # building depreciation (AfA), 2% a year for most residential buildings
+        sidebar.depreciation_rate = (
+            st.number_input(
+                "Building depreciation %", value=2.0, format="%.2f", step=0.5
             )
-        with col_3:
-            st.markdown(
-                f"""
-                    Contracted loan: **{round(sidebar.loan_total):,}** €
-
-                    Loan balance after **{int(sidebar.n_years)}** years: **{round(sidebar.loan_balance):,}** €
-
-                    Total paid interests: **{round(sidebar.total_interests):,}** €
-                """
+            / 100
+        )
+        sidebar.marginal_tax_rate = (
+            st.number_input(
+                "Marginal tax rate %",
+                value=42.0,
+                min_value=0.0,
+                max_value=100.0,
+                format="%.1f",
+                step=1.0,
             )
+            / 100
+        )
+    return sidebar
 
 
-@declare_view("Combined mortgages")
-def show_combined_mortages(*args, **kwargs):
+@declare_view("Rental property")
+def show_rental_property(*args, **kwargs):
 
     sidebar = Box()
-    mortgage_length_toggle = st.sidebar.radio(
-        "Mortgage length", ["20 years", "15 years"]
-    )
-    interests_only_period = st.sidebar.number_input(
-        "Interest only period (years)",
-        value=2,
-        min_value=0,
+    sidebar = make_section_property(sidebar)
+    sidebar = make_section_acquisition_cost(sidebar)
+    sidebar = make_section_mortgage(sidebar)
+    sidebar = make_section_rental(sidebar)
+
+    phase("computation")
+    schedule = get_loan_schedule(
+        n_years=sidebar.n_years,
+        loan_total=sidebar.loan_total,
+        interest_rate=sidebar.interest_rate,
+        monthly_payment=sidebar.monthly_payment,
+        annual_extra_repayment_rate=sidebar.annual_extra_repayment_rate,
+    )
+    # only the building (house value) depreciates, not the plot
+    assumptions = dict(
+        loan_summary=schedule,
+        building_value=sidebar.house_value,
+        yearly_rent=sidebar.yearly_rent,
+        rent_increase_rate=sidebar.rent_increase_rate,
+        yearly_costs=sidebar.yearly_costs,
+    )
+    flows = get_rental_cash_flows(
+        depreciation_rate=sidebar.depreciation_rate,
+        marginal_tax_rate=sidebar.marginal_tax_rate,
+        **assumptions,
+    )
+
+    # every (marginal tax rate, depreciation rate) pair of the grid at once
+    tax_rates = np.arange(0.0, 45.01, 5.0)
+    depreciation_rates = np.arange(1.0, 4.01, 0.5)
+    grid = get_rental_cash_flows(
+        depreciation_rate=depreciation_rates[None, :] / 100,
+        marginal_tax_rate=tax_rates[:, None] / 100,
+        **assumptions,
+    )
+
+    n_years = int(sidebar.n_years)
+    st.markdown(
+        f"""
+        After-tax cash flow over **{n_years}** years: **{round(flows["after-tax cash flow"].sum()):,}** €
+        (**{round(flows["cash flow"].sum()):,}** € before tax)
+
+        - Depreciation base (building): **{round(sidebar.house_value):,}** €, deducted: **{round(flows["depreciation"].sum()):,}** €
+        - Deducted interests: **{round(flows["interests"].sum()):,}** €
+        - Income tax: **{round(flows["tax"].sum()):,}** € (negative for a refund)
+        - Monthly after-tax cash flow in the first year: **{round(flows["after-tax cash flow"][0] / 12):,}** €
+        """
+    )
+
+    phase("table render")
+    df = pd.DataFrame(
+        {column: flows[column] for column in RENTAL_COLUMNS},
+        index=pd.Index(schedule["year"], name="year"),
+    )
+    with st.expander("Show table", expanded=False):
+        st.dataframe(df.style.format("{:,.0f}"), width=1500)
+
+    phase("chart build")
+    df_melt = (
+        df[["cash flow", "after-tax cash flow"]]
+        .reset_index()
+        .melt(["year"], var_name="type", value_name="yearly amount")
     )
-    start_month = st.sidebar.number_input(
-        "Starting month", min_value=1, max_value=12, value=9, step=0
+    df_melt = round_columns(
+        downsample_lines(df_melt, "year", "yearly amount", by="type"),
+        columns=["yearly amount"],
     )
-
-    # sidebar = make_section_property(sidebar)
-    # sidebar = make_section_acquisition_cost(sidebar)
-
-    if mortgage_length_toggle == "20 years":
-        sidebar = make_section_mortgage(
-            sidebar,
-            amount=708_000,
-            interest=1.41,
-            n_years=20,
-            monthly=23930 / 12,
-            prefix="VRBank",
-        )
-    elif mortgage_length_toggle == "15 years":
-        sidebar = make_section_mortgage(
-            sidebar,
-            amount=708_000,
-            interest=1.17,
-            n_years=15,
-            monthly=22302 / 12,
-            prefix="VRBank",
+    show_chart(
+        alt.Chart(df_melt)
+        .mark_line(point=True)
+        .encode(
+            x="year:O",
+            y="yearly amount:Q",
+            color="type:N",
+            tooltip=["year", "type", "yearly amount"],
         )
-
-    sidebar = make_section_mortgage(
-        sidebar,
-        amount=160_000,
-        interest=0.87,
-        n_years=10,
-        monthly=6512.04 / 12,
-        prefix="KfW",
-    )
-    sidebar = make_section_mortgage(
-        sidebar,
-        amount=200_000,
-        interest=0.20,
-        n_years=10,
-        monthly=4400.04 / 12,
-        prefix="CO2",
-    )
-
-    # Mortgage 1
-    df_summary_vr = get_loan_summary(
-        start_month=start_month,
-        interests_only_period=interests_only_period,
-        **sidebar.VRBank,
-    )
-
-    df_summary_vr = df_summary_vr[
-        ["monthly_interests", "monthly_principal", "loan balance"]
-    ]
-    df_summary_vr.rename(
-        columns={
-            "monthly_interests": "VR Interests",
-            "monthly_principal": "VR Principal",
-            "loan balance": "VR Balance",
-        },
-        inplace=True,
-    )
-
-    # Mortgage 2
-    df_summary_kfw = get_loan_summary(
-        start_month=start_month,
-        interests_only_period=interests_only_period,
-        **sidebar.KfW,
-    )
-
-    df_summary_kfw = df_summary_kfw[
-        ["monthly_interests", "monthly_principal", "loan balance"]
-    ]
-    df_summary_kfw.rename(
-        columns={
-            "monthly_interests": "KfW Interests",
-            "monthly_principal": "KfW Principal",
-            "loan balance": "KfW Balance",
-        },
-        inplace=True,
-    )
-
-    # Mortgage 3
-    df_summary_co2 = get_loan_summary(
-        start_month=start_month,
-        interests_only_period=interests_only_period,
-        **sidebar.CO2,
-    )
-
-    df_summary_co2 = df_summary_co2[
-        ["monthly_interests", "monthly_principal", "loan balance"]
-    ]
-    df_summary_co2.rename(
-        columns={
-            "monthly_interests": "CO2 Interests",
-            "monthly_principal": "CO2 Principal",
-            "loan balance": "CO2 Balance",
-        },
-        inplace=True,
-    )
-
-    df_summary = (
-        df_summary_vr.join(df_summary_kfw, how="outer")
-        .join(df_summary_co2, how="outer")
-        .fillna(0.0)
-    )
-
-    df_summary["Total Interests"] = (
-        df_summary["VR Interests"]
-        + df_summary["KfW Interests"]
-        + df_summary["CO2 Interests"]
-    )
-    df_summary["Total Principal"] = (
-        df_summary["VR Principal"]
-        + df_summary["KfW Principal"]
-        + df_summary["CO2 Principal"]
-    )
-    df_summary["Total Balance"] = (
-        df_summary["VR Balance"] + df_summary["KfW Balance"] + df_summary["CO2 Balance"]
-    )
-    # sidebar.loan_balance = df_summary_vr.iloc[-1, -1]
-    # sidebar.total_interests = df_summary_vr["annual_interests"].sum()
-
-    with st.expander("Show table", expanded=True):
-        st.dataframe(df_summary.style.format("{:,.0f}"), width=1500)
-
-    df_summary_melt = (
-        df_summary[
-            [
-                "VR Interests",
-                "VR Principal",
-                "KfW Interests",
-                "KfW Principal",
-                "CO2 Interests",
-                "CO2 Principal",
-            ]
-        ]
-        .reset_index()
-        .melt(["year"], var_name="repayment type", value_name="monthly amount")
+        .properties(width=800, height=300)
+        .configure_axis(grid=False)
+        .configure_view(strokeWidth=0),
+        name="cash flows",
+        use_container_width=True,
     )
 
-    df_summary_melt["monthly amount"] = df_summary_melt["monthly amount"].apply(round)
-
-    st.altair_chart(
-        alt.Chart(df_summary_melt)
-        .mark_bar(cornerRadiusTopLeft=0, cornerRadiusTopRight=0)
-        .transform_calculate(amount="datum['monthly amount'] + ' €'")
+    rates, depreciations = np.meshgrid(tax_rates, depreciation_rates, indexing="ij")
+    df_grid = pd.DataFrame(
+        {
+            "marginal tax rate %": rates.ravel(),
+            "depreciation %": depreciations.ravel(),
+            "after-tax cash flow": grid["after-tax cash flow"]
+            .sum(axis=-1)
+            .ravel()
+            .round(),
+        }
+    )
+    show_chart(
+        alt.Chart(df_grid)
+        .mark_rect()
         .encode(
-            x="year:N",
-            y="monthly amount:Q",
-            color="repayment type:N",
-            opacity=alt.value(0.9),
-            tooltip=["repayment type", "amount:N"],
+            x="depreciation %:O",
+            y=alt.Y("marginal tax rate %:O", sort="descending"),
+            color=alt.Color(
+                "after-tax cash flow:Q", scale=alt.Scale(scheme="redyellowgreen")
+            ),
+            tooltip=["marginal tax rate %", "depreciation %", "after-tax cash flow"],
+        )
+        .properties(
+            title=f"After-tax cash flow over {n_years} years", width=400, height=300
         )
-        .properties(width=800, height=400)
         .configure_axis(grid=False)
         .configure_view(strokeWidth=0),
-        use_container_width=True,
+        name="tax grid",
     )
@@ -0,0 +1,161 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import streamlit as st
+
+from investr.common.cache import make_key
+from investr.common.store import STORE_ERRORS, source_version, store
+
+# Worker processes shared by all the sessions of the app
+WORKERS = int(os.environ.get("INVESTR_WORKERS", min(4, os.cpu_count() or 1)))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # the server is multithreaded, forking it is not safe
+            _pool = ProcessPoolExecutor(
+                WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+class Job:
+    # func called with each chunk of keyword arguments on the worker pool.
+    # At most max_in_flight chunks are queued at a time, so that the jobs of
+    # other sessions get workers too, and the next chunks are submitted as
+    # the previous ones finish. combine turns the chunk results (None for the
+    # unfinished ones) into the partial or final result of the job, which is
+    # read from and written to the result store.
+    def __init__(self, key, func, chunks, combine, max_in_flight):
+        self.key = key
+        self.func = func
+        self.chunks = list(chunks)
+        self.combine = combine
+        self.max_in_flight = max_in_flight
+        self.results = [None] * len(self.chunks)
+        self.n_done = 0
+        self.error = None
+        self.cancelled = False
+        self._final = None
+        self._next = 0
+        self._futures = set()
+        self._lock = threading.RLock()
+        self._done = threading.Event()
+
+    def start(self):
+        if store is not None:
+            try:
+                self._final = store.get(self.key)
+            except (KeyError, *STORE_ERRORS):
+                pass
+            else:
+                self.n_done = len(self.chunks)
+                self._done.set()
+                return self
+        with self._lock:
+            self._submit()
+            if not self.chunks:
+                self._done.set()
+        return self
+
+    def _submit(self):
+        while (
+            not self.cancelled
+            and self.error is None
+            and self._next < len(self.chunks)
+            and len(self._futures) < self.max_in_flight
+        ):
+            n = self._next
+            self._next += 1
+            future = get_pool().submit(self.func, **self.chunks[n])
+            self._futures.add(future)
+            future.add_done_callback(partial(self._finish, n))
+
+    def _finish(self, n, future):
+        with self._lock:
+            self._futures.discard(future)
+            if not future.cancelled():
+                if future.exception() is not None:
+                    self.error = future.exception()
+                else:
+                    self.results[n] = future.result()
+                    self.n_done += 1
+            self._submit()
+            if self.n_done == len(self.chunks) or not self._futures:
+                self._done.set()
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            for future in list(self._futures):
+                future.cancel()
+            if not self._futures:
+                self._done.set()
+
+    @property
+    def progress(self):
+        return self.n_done / len(self.chunks) if self.chunks else 1.0
+
+    def done(self):
+        return self._done.is_set()
+
+    def partial(self):
+        if self._final is not None:
+            return self._final
+        with self._lock:
+            return self.combine(list(self.results))
+
+    def result(self):
+        self._done.wait()
+        if self.error is not None:
+            raise self.error
+        if self._final is None:
+            self._final = self.combine(self.results)
+            # the chunk results can be large, the job keeps the final one
+            self.results = [None] * len(self.chunks)
+            if store is not None and self.n_done == len(self.chunks):
+                try:
+                    store.put(self.key, self._final)
+                except STORE_ERRORS:
+                    pass
+        return self._final
+
+    def stream(self, interval=0.2):
+        # (progress, partial result) every time chunks have finished, the
+        # final result last
+        n_seen = -1
+        while not self._done.wait(interval):
+            if self.n_done != n_seen and self.n_done > 0:
+                n_seen = self.n_done
+                yield self.progress, self.partial()
+        yield self.progress, self.result()
+
+
+def submit_job(name, func, chunks, combine, max_in_flight=None):
+    # Per-session job queue holding one job per name. Submitting the same
+    # chunks again (a rerun with unchanged inputs) returns the running job,
+    # other chunks cancel it and start a new one.
+    chunks = list(chunks)
+    key = make_key(
+        func.__module__, func.__qualname__, source_version(func), name, chunks
+    )
+    jobs = st.session_state.setdefault("jobs", {})
+
+    job = jobs.get(name)
+    if job is not None:
+        if job.key == key and not job.cancelled and job.error is None:
+            return job
+        job.cancel()
+
+    if max_in_flight is None:
+        max_in_flight = max(WORKERS // 2, 1)
+    jobs[name] = job = Job(key, func, chunks, combine, max_in_flight)
+    return job.start()
@@ -1,10 +1,27 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
 import altair as alt
 
 from box import Box
-from investr.views.register import declare_view
-from investr.common.mortgage import get_loan_summary
+from investr.common.store import persisted
+from investr.views.charts import (
+    bucket_bars,
+    downsample_lines,
+    round_columns,
+    show_chart,
+)
+from investr.views.register import declare_view, phase
+from investr.common.mortgage import (
+    get_break_even_year,
+    get_loan_schedule,
+    get_monthly_loan_schedule,
+    get_property_loan_totals,
+    get_rent_vs_buy_scenarios,
+    get_sensitivities,
+    schedule_to_frame,
+    solve_loan,
+)
 
 
 def make_sidebar(sidebar):
@@ -85,17 +102,109 @@ def make_sidebar(sidebar):
             / 100
         )
 
+        sidebar.resolution = st.radio("Schedule resolution", ["yearly", "monthly"])
+
     return sidebar
 
 
+# inputs of the sensitivity analysis and their labels
+SENSITIVITY_INPUTS = {
+    "plot_value": "Plot value",
+    "house_value": "Flat/house value",
+    "extra_house_cost": "Extra house costs",
+    "downpayment": "Downpayment",
+    "real_estate_rate": "Real-estate %",
+    "property_transfer_tax_rate": "Property-transfer tax %",
+    "notary_rate": "Notary %",
+    "n_years": "Number of years",
+    "interest_rate": "Interest rate %",
+    "monthly_payment": "Monthly payment",
+    "annual_extra_repayment_rate": "Annual extra repayment %",
+}
+SENSITIVITY_OUTPUTS = ["total interests", "loan balance"]
+
+
+def make_tornado(df, output):
+    return (
+        alt.Chart(df)
+        .mark_bar()
+        .encode(
+            x=alt.X(f"{output}:Q", title=f"change of the {output}"),
+            y=alt.Y(
+                "input:N",
+                sort=alt.EncodingSortField(f"{output} swing", order="descending"),
+                title=None,
+            ),
+            color=alt.Color("perturbation:N", sort=["down", "up"]),
+            tooltip=["input", "perturbation", "value", f"{output}:Q"],
+        )
+        .properties(title=output.capitalize(), width=350, height=300)
+    )
+
+
+def show_sensitivity(sidebar):
+    relative_step = st.slider("Perturbation of every input %", 1, 50, 10, step=1) / 100
+
+    phase("computation")
+    # 2 scenarios per input and the unchanged one in a single batched call
+    inputs = list(SENSITIVITY_INPUTS)
+    values, outputs = get_sensitivities(
+        get_property_loan_totals,
+        inputs,
+        relative_step,
+        integers=("n_years",),
+        **{name: sidebar[name] for name in inputs},
+    )
+
+    phase("chart build")
+    labels = list(SENSITIVITY_INPUTS.values())
+    df = pd.DataFrame(
+        {
+            "input": np.repeat(labels, 2),
+            "perturbation": np.tile(["down", "up"], len(labels)),
+            "value": values.ravel(),
+        }
+    )
+    for output, result in zip(SENSITIVITY_OUTPUTS, outputs):
+        change = result["values"] - result["base"]
+        df[output] = change.ravel().round()
+        df[f"{output} swing"] = np.repeat(np.ptp(change, axis=1), 2)
+
+    show_chart(
+        alt.hconcat(*[make_tornado(df, output) for output in SENSITIVITY_OUTPUTS])
+        .configure_axis(grid=False)
+        .configure_view(strokeWidth=0),
+        name="tornado",
+        use_container_width=True,
+    )
+
+    phase("table render")
+    st.markdown(
+        "Elasticities: % change of the output for a 1% change of the input "
+        "(inputs at 0 are not perturbed)."
+    )
+    st.dataframe(
+        pd.DataFrame(
+            {
+                f"{output} elasticity": result["elasticity"]
+                for output, result in zip(SENSITIVITY_OUTPUTS, outputs)
+            },
+            index=pd.Index(labels, name="input"),
+        ).style.format("{:.2f}", na_rep="-"),
+        width=1500,
+    )
+
+
 @declare_view("Real-estate")
 def show_realestate(*args, **kwargs):
 
     sidebar = Box()
     sidebar = make_sidebar(sidebar)
 
-    df_summary = get_loan_summary(**sidebar)
-    loan_balance = df_summary.iloc[-1, -1]
+    phase("computation")
+    schedule = get_loan_schedule(**sidebar)
+    loan_balance = schedule["loan balance"][-1]
+    required_payment = persisted(solve_loan)("monthly_payment", **sidebar)
 
     with st.expander("Summary", True):
         col_1, col_2, col_3 = st.columns(3)
@@ -144,20 +253,38 @@ def show_realestate(*args, **kwargs):
 
                     Loan balance after **{int(sidebar.n_years)}** years: **{round(loan_balance):,}** €
 
-                    Total paid interests: **{round(df_summary["annual_interests"].sum()):,}** €
+                    Total paid interests: **{round(schedule["annual_interests"].sum()):,}** €
+
+                    Monthly payment to repay it in **{int(sidebar.n_years)}** years: **{round(float(required_payment)):,}** €
                 """
             )
 
+    phase("table render")
+    df_summary = schedule_to_frame(schedule)
     with st.expander("Show table", expanded=False):
         st.table(df_summary.style.format("{:,.0f}"))
 
+    if sidebar.resolution == "monthly":
+        with st.expander("Show monthly schedule", expanded=False):
+            st.dataframe(
+                schedule_to_frame(get_monthly_loan_schedule(**sidebar)).style.format(
+                    "{:,.0f}"
+                ),
+                width=1500,
+            )
+
+    phase("chart build")
     df_summary_melt = (
         df_summary[["monthly_interests", "monthly_principal"]]
         .reset_index()[["year", "monthly_interests", "monthly_principal"]]
         .melt(["year"], var_name="repayment type", value_name="monthly amount")
     )
+    df_summary_melt = round_columns(
+        bucket_bars(df_summary_melt, "year", "monthly amount", by="repayment type"),
+        columns=["monthly amount"],
+    )
 
-    st.altair_chart(
+    show_chart(
         alt.Chart(df_summary_melt)
         .mark_bar(cornerRadiusTopLeft=0, cornerRadiusTopRight=0)
         .encode(
@@ -169,182 +296,185 @@ def show_realestate(*args, **kwargs):
         .properties(width=800, height=200)
         .configure_axis(grid=False)
         .configure_view(strokeWidth=0),
+        name="repayments",
         use_container_width=True,
     )
 
-    st.stop()
+    st.write("---")
+    st.subheader("Sensitivity")
+    show_sensitivity(sidebar)
 
     st.write("---")
     st.subheader("Return on investment vs renting")
 
-    # yearly_cold_rent = 1000 * 12
-    # rent_increase_rate = 0.02
-    # yearly_maintenance_cost = 220 * 12
-    # yearly_property_tax = 150
-
-    col1, col2, col3, col4 = st.columns(4)
+    phase("sidebar input")
+    col1, col2, col3 = st.columns(3)
 
     with col1:
         yearly_cold_rent = (
             st.number_input("Monthly cold rent", value=1000, step=50) * 12
         )
-    with col2:
         rent_increase_rate = (
-            st.number_input("Rent yearly increase rate %", value=2, format="%d", step=1)
+            st.number_input(
+                "Rent yearly increase rate %", value=2.0, format="%.1f", step=0.5
+            )
             / 100
         )
-    with col3:
+    with col2:
         yearly_maintenance_cost = st.number_input(
             "Yearly maintenance cost", value=220 * 12
         )
-    with col4:
         yearly_property_tax = st.number_input("Property yearly tax", value=150)
+    with col3:
+        property_appreciation_rate = (
+            st.number_input(
+                "Property annual appreciation rate %",
+                value=1.0,
+                format="%.1f",
+                step=0.5,
+            )
+            / 100
+        )
+        market_return = (
+            st.number_input(
+                "Market annual return %", value=5.0, format="%.1f", step=0.5
+            )
+            / 100
+        )
 
     st.write(
         "We assume the rent increases by",
-        round(rent_increase_rate * 100),
-        "% each year. The cold rest is at",
+        round(rent_increase_rate * 100, 1),
+        "% each year. The cold rent is at",
         round(yearly_cold_rent / 12),
         "€. The yearly maintenance costs are",
         yearly_maintenance_cost,
         "€, and the annual property tax is",
         yearly_property_tax,
-        "€.",
+        "€. The renter invests the downpayment, and each year the cheaper "
+        "option invests the difference, at the market return.",
     )
 
-    yearly_agg_summary = aggregate_summary(df_summary, period_names, 12)
-
-    property_appreciation_rate = (
-        st.number_input(
-            "Property annual appreciation rate %", value=0, format="%d", step=1
-        )
-        / 100
+    phase("computation")
+    assumptions = dict(
+        loan_summary=schedule,
+        property_value=sidebar.property_value,
+        initial_cash=sidebar.downpayment,
+        yearly_cold_rent=yearly_cold_rent,
+        rent_increase_rate=rent_increase_rate,
+        yearly_maintenance_cost=yearly_maintenance_cost,
+        yearly_property_tax=yearly_property_tax,
     )
-
-    df = get_roi(
-        yearly_agg_summary,
-        property_value,
-        extra_fees_total,
-        yearly_cold_rent,
-        n_years,
-        rent_increase_rate,
-        yearly_maintenance_cost,
-        yearly_property_tax,
-        surface,
-        property_appreciation_rate,
+    roi = get_rent_vs_buy_scenarios(
+        property_appreciation_rate=property_appreciation_rate,
+        market_return=market_return,
+        **assumptions,
+    )
+    break_even = get_break_even_year(roi["difference"])
+
+    # every (appreciation rate, market return) pair of the grid at once
+    appreciation_rates = np.arange(-2.0, 6.01, 0.5)
+    market_returns = np.arange(0.0, 10.01, 0.5)
+    grid = persisted(get_rent_vs_buy_scenarios)(
+        property_appreciation_rate=appreciation_rates[:, None] / 100,
+        market_return=market_returns[None, :] / 100,
+        **assumptions,
+    )
+    grid_break_even = get_break_even_year(grid["difference"])
+
+    if np.isnan(break_even):
+        st.markdown(f"Buying does not break even within **{len(roi['year'])}** years.")
+    else:
+        st.markdown(f"Buying breaks even after **{int(break_even)}** years.")
+    st.markdown(
+        f"Networth difference after **{len(roi['year'])}** years: "
+        f"**{round(roi['difference'][-1]):,}** €"
     )
 
-    # TODO: This part needs refactoring
-
+    phase("table render")
+    df = pd.DataFrame(roi)
     with st.expander("show ROI yearly data"):
         st.write(df.set_index("year").style.format("{:,.0f}"))
 
+    phase("chart build")
+    df_networth = df[["year", "buy networth", "rent networth"]].melt(
+        ["year"], var_name="option", value_name="networth"
+    )
+    df_networth = round_columns(
+        downsample_lines(df_networth, "year", "networth", by="option"),
+        columns=["networth"],
+    )
+
     nearest = alt.selection(
         type="single", nearest=True, on="mouseover", fields=["year"], empty="none"
     )
     line = (
-        alt.Chart(df)
-        .mark_area(interpolate="basis", point=True)
+        alt.Chart(df_networth)
+        .mark_line(interpolate="basis", point=True)
         .encode(
             x="year:Q",
             y="networth:Q",
-            color=alt.Color("variable:N", legend=None),
-            opacity=alt.value(0.4),
-        )
-    )
-
-    selectors = (
-        line.mark_point()
-        .encode(opacity=alt.condition(nearest, alt.value(1), alt.value(0)))
-        .add_selection(nearest)
-    )
-
-    text = (
-        line.mark_text(align="left", dx=5, dy=-45)
-        .encode(
-            text=alt.condition(nearest, "label:N", alt.value(" ")), opacity=alt.value(1)
+            color=alt.Color("option:N"),
+            tooltip=["option", "year", "networth"],
         )
-        .transform_calculate(label='format(round(datum.networth), ",") + "€"')
     )
-    # ).transform_calculate(label='format(datum.value, ",").replace(",", " ") + "€"')
-    # ).transform_calculate(label='format(datum.value, ",") + "€"')
-
     rules = (
-        alt.Chart(df)
+        alt.Chart(df_networth)
         .mark_rule(color="gray")
         .encode(x="year:Q")
         .transform_filter(nearest)
     )
+    selectors = (
+        line.mark_point()
+        .encode(opacity=alt.condition(nearest, alt.value(1), alt.value(0)))
+        .add_selection(nearest)
+    )
 
-    equilib_mark = (
-        alt.Chart(pd.DataFrame({"networth": [0]}))
-        .mark_rule(strokeDash=[5, 5])
-        .encode(y="networth:Q")
+    show_chart(
+        alt.layer(line, selectors, rules)
+        .properties(width=700, height=400)
+        .configure_axis(grid=False)
+        .configure_view(strokeWidth=0),
+        name="rent vs buy",
+        use_container_width=True,
     )
 
-    # other_info_interests = alt.Chart(df).mark_line().encode(
-    #     x="year:Q",
-    #     y="interests:Q",
-    #     opacity=alt.value(0.5)
-    # )
-    # other_info_rent = alt.Chart(df).mark_line().encode(
-    #     x="year:Q",
-    #     y="rent:Q",
-    #     opacity=alt.value(0.5)
-    # )
-
-    chart = alt.layer(line, selectors, rules, text, equilib_mark).properties(
-        width=700, height=500
+    st.markdown("**Where buying wins**")
+    rates, returns = np.meshgrid(appreciation_rates, market_returns, indexing="ij")
+    df_grid = pd.DataFrame(
+        {
+            "appreciation rate %": rates.ravel(),
+            "market return %": returns.ravel(),
+            "difference": grid["difference"][..., -1].ravel().round(),
+            "break-even year": grid_break_even.ravel(),
+        }
     )
 
-    property_value_chart = (
-        alt.Chart(df)
-        .mark_line(point=True)
+    show_chart(
+        alt.Chart(df_grid)
+        .mark_rect()
         .encode(
-            x="year:Q",
-            y="property:Q",
-            tooltip=["label:N", "m2 price:Q"],
+            x=alt.X("market return %:O", axis=alt.Axis(format=".1f")),
+            y=alt.Y(
+                "appreciation rate %:O",
+                sort="descending",
+                axis=alt.Axis(format=".1f"),
+            ),
+            color=alt.Color(
+                "difference:Q",
+                title="buy - rent",
+                scale=alt.Scale(scheme="redblue", domainMid=0),
+            ),
+            tooltip=[
+                "appreciation rate %",
+                "market return %",
+                alt.Tooltip("difference:Q", format=",.0f"),
+                "break-even year:Q",
+            ],
         )
-        .transform_calculate(label='format(round(datum.property), ",") + "€"')
-        .properties(width=700, height=200)
+        .properties(width=500, height=400)
+        .configure_axis(grid=False)
+        .configure_view(strokeWidth=0),
+        name="where buying wins",
+        use_container_width=True,
     )
-
-    combined_chart = chart  # + property_value_chart
-    combined_chart.configure_axis(grid=False).configure_view(strokeWidth=0)
-    combined_chart
-
-    property_value_chart
-
-    with st.expander("Other charts", expanded=False):
-        keep_cols = ["year", "property share", "interests", "rent", "extra costs"]
-        df_other = df.loc[:, keep_cols].melt(
-            id_vars=["year"], value_vars=keep_cols.remove("year")
-        )
-
-        other_charts = (
-            (
-                alt.Chart(df_other)
-                .mark_line(interpolate="basis", point=False)
-                .encode(
-                    x="year:Q",
-                    y="value:Q",
-                    color=alt.Color("variable:N"),
-                    opacity=alt.value(0.4),
-                )
-            )
-            .properties(width=700, height=400)
-            .interactive()
-        )
-        other_charts
-        # keep = ["year", "amount invested", "property share", "interests", "rent", "extra costs", "networth", "property", "m2 price"]
-
-    # line = alt.Chart(df).mark_line(interpolate='basis', point=True).encode(
-    #     x='year:Q',
-    #     y='value:Q',
-    #     color='variable:N',
-    #     tooltip=['value'],
-    # )
-    # st.altair_chart(line)
-
-    # st.write('---')
-    # st.subheader("Exploration")
@@ -1,19 +1,125 @@
+import cProfile
+import importlib
+import io
+import pstats
+import threading
+import time
 from functools import wraps
 
 register = {}
+load_times = {}
+
+PHASES = ["sidebar input", "computation", "chart build", "table render"]
+
+# Streamlit runs every session in its own script thread
+_local = threading.local()
+
+
+class LazyView:
+    # Placeholder for a view whose module is only imported once the view is
+    # selected; importing the module declares the actual view.
+    def __init__(self, name, module):
+        self.name = name
+        self.module = module
+
+    def __call__(self, *args, **kwargs):
+        return load_view(self.name)(*args, **kwargs)
+
+
+class ViewTimings:
+    # Wall time per phase of a view run. Views switch phases with phase(name),
+    # the time spent in a phase entered several times is summed. detailed
+    # runs (profiled views) also record the costlier metrics.
+    def __init__(self, view, detailed=False):
+        self.view = view
+        self.detailed = detailed
+        self.phases = {}
+        self.extra = {}
+        self.profile = None
+        self._phase = None
+        self._phase_start = None
+        self._start = time.perf_counter()
+        self.total = None
+
+    def start_phase(self, name):
+        now = time.perf_counter()
+        if self._phase is not None:
+            self.phases[self._phase] = (
+                self.phases.get(self._phase, 0.0) + now - self._phase_start
+            )
+        self._phase = name
+        self._phase_start = now
+
+    def stop(self):
+        self.start_phase(None)
+        self.total = time.perf_counter() - self._start
+
+    def to_dict(self):
+        return {
+            "view": self.view,
+            "total": self.total,
+            "phases": self.phases,
+            **self.extra,
+        }
+
+
+def phase(name):
+    timings = current_timings()
+    if timings is not None:
+        timings.start_phase(name)
+
+
+def current_timings():
+    return getattr(_local, "timings", None)
+
+
+def declare_lazy_view(name, module):
+    assert name not in register, f"The view name exists already. Register: {register}"
+    register[name] = LazyView(name, module)
+
+
+def load_view(name):
+    view = register[name]
+    if isinstance(view, LazyView):
+        start = time.perf_counter()
+        importlib.import_module(view.module)
+        load_times[name] = time.perf_counter() - start
+        view = register[name]
+        assert not isinstance(
+            view, LazyView
+        ), f"{view.module} does not declare the view {name}"
+    return view
 
 
 def declare_view(name):
     def outer_wrapper(func):
-        assert (
-            name not in register
+        lazy_view = register.get(name)
+        assert name not in register or (
+            isinstance(lazy_view, LazyView) and lazy_view.module == func.__module__
         ), f"The view name exists already. Register: {register}"
-        register[name] = func
 
-        @wraps
-        def wrapper(*args, **kwargs):
-            return func(*args, **kwargs)
+        @wraps(func)
+        def wrapper(*args, profile=False, **kwargs):
+            timings = ViewTimings(name, detailed=profile)
+            _local.timings = timings
+            profiler = cProfile.Profile() if profile else None
+
+            timings.start_phase(PHASES[0])
+            if profiler is not None:
+                profiler.enable()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+                    stream = io.StringIO()
+                    pstats.Stats(profiler, stream=stream).sort_stats(
+                        "cumulative"
+                    ).print_stats(30)
+                    timings.profile = stream.getvalue()
+                timings.stop()
 
+        register[name] = wrapper
         return wrapper
 
     return outer_wrapper
@@ -1,8 +1,28 @@
+import os
+
+import altair as alt
+import numpy as np
 import pandas as pd
 import streamlit as st
 
 from box import Box
-from investr.views.register import declare_view
+from investr.views.charts import downsample_lines, show_chart
+from investr.views.jobs import submit_job
+from investr.views.register import declare_view, phase
+from investr.common.growth import (
+    PERCENTILES,
+    get_invested,
+    get_percentiles,
+    simulate_paths,
+)
+from investr.common.store import persisted
+from investr.common.history import (
+    backtest_networth,
+    list_return_series,
+    load_return_series,
+)
+
+PATHS_PER_CHUNK = 20_000
 
 
 def make_sidebar(sidebar):
@@ -21,9 +41,214 @@ def make_sidebar(sidebar):
             st.number_input("Years of investment", min_value=1, value=20, step=1)
         )
 
+    with st.sidebar.expander("Simulation", True):
+        sidebar.mode = st.radio("Returns", ["Deterministic", "Monte Carlo", "Backtest"])
+        if sidebar.mode == "Monte Carlo":
+            sidebar.volatility = st.number_input(
+                "annual volatility (%)", min_value=0.0, max_value=100.0, value=15.0
+            )
+            sidebar.distribution = st.selectbox(
+                "Distribution", ["log-normal", "normal"]
+            )
+            sidebar.n_paths = int(
+                st.number_input(
+                    "Number of paths", min_value=100, value=100_000, step=10_000
+                )
+            )
+            sidebar.seed = int(st.number_input("Seed", min_value=0, value=0))
+        if sidebar.mode == "Backtest":
+            series = {os.path.basename(path): path for path in list_return_series()}
+            sidebar.series = series.get(
+                st.selectbox("Return series", ["Upload"] + list(series))
+            )
+            if sidebar.series is None:
+                sidebar.upload = st.file_uploader(
+                    "Monthly returns (CSV or .npy)", ["csv", "npy"]
+                )
+
     return sidebar
 
 
+def combine_paths(results):
+    # number of paths simulated so far and their (percentile, year) bands
+    paths = [r for r in results if r is not None]
+    if not paths:
+        return 0, None
+    paths = np.concatenate(paths)
+    return len(paths), get_percentiles(paths)
+
+
+def show_bands(sidebar, start_year, n_paths, bands):
+    n_years = sidebar.n_years
+    annual_invest = sidebar.monthly_invest * 12
+    invested = get_invested(
+        sidebar.starting_value, annual_invest, sidebar.yearly_etra, n_years
+    )
+
+    df = pd.DataFrame(bands.T.round(), columns=[f"p{p}" for p in PERCENTILES]).assign(
+        year=range(start_year - 1, start_year + n_years),
+        invested=invested,
+    )
+
+    st.markdown(
+        f"Median networth after {n_years} years is **{round(df.p50.iloc[-1]):,} €**"
+        f" (90% of the {n_paths:,} paths between **{round(df.p5.iloc[-1]):,} €**"
+        f" and **{round(df.p95.iloc[-1]):,} €**), with **{round(invested[-1]):,}** € invested."
+    )
+
+    phase("chart build")
+    base = alt.Chart(df).encode(x=alt.X("year:O"))
+    show_chart(
+        alt.layer(
+            base.mark_area(opacity=0.2).encode(
+                y=alt.Y("p5:Q", title="networth"), y2="p95:Q"
+            ),
+            base.mark_area(opacity=0.4).encode(y="p25:Q", y2="p75:Q"),
+            base.mark_line().encode(y="p50:Q"),
+            base.mark_line(strokeDash=[5, 5], color="gray").encode(y="invested:Q"),
+        )
+        .properties(width=800, height=400)
+        .configure_axis(grid=False)
+        .configure_view(strokeWidth=0),
+        name="percentile bands",
+        use_container_width=True,
+    )
+
+    phase("table render")
+    st.dataframe(df.set_index("year"), width=1500)
+
+
+def show_monte_carlo(sidebar, start_year):
+    phase("computation")
+    # paths are simulated by chunks on the worker pool, the bands of the
+    # chunks already simulated are shown while the others run
+    n_chunks = -(-sidebar.n_paths // PATHS_PER_CHUNK)
+    chunks = [
+        dict(
+            annual_gain=sidebar.annual_gain / 100.0,
+            volatility=sidebar.volatility / 100.0,
+            n_years=sidebar.n_years,
+            n_paths=int(n_paths),
+            distribution=sidebar.distribution,
+            seed=(sidebar.seed, n),
+            starting_value=sidebar.starting_value,
+            annual_invest=sidebar.monthly_invest * 12,
+            yearly_extra=sidebar.yearly_etra,
+        )
+        for n, n_paths in enumerate(
+            np.diff(np.linspace(0, sidebar.n_paths, n_chunks + 1).round())
+        )
+    ]
+    job = submit_job("monte carlo", simulate_paths, chunks, combine_paths)
+
+    # the progress bar has no label before streamlit 1.18
+    progress, status = st.progress(0.0), st.empty()
+    output = st.empty()
+    for done, (n_paths, bands) in job.stream():
+        progress.progress(done)
+        status.caption(f"{n_paths:,} of {sidebar.n_paths:,} paths simulated")
+        with output.container():
+            show_bands(sidebar, start_year, n_paths, bands)
+    progress.empty()
+    status.empty()
+
+
+def show_backtest(sidebar):
+    n_years = sidebar.n_years
+    annual_invest = sidebar.monthly_invest * 12
+
+    if sidebar.series is not None:
+        source, name = sidebar.series, sidebar.series
+    elif sidebar.upload is not None:
+        source, name = sidebar.upload.getvalue(), sidebar.upload.name
+    else:
+        st.info(
+            "Upload monthly returns (0.01 = 1%): a CSV with the months in the first"
+            " column and one column per asset, or a (month, asset) .npy array."
+        )
+        return
+
+    phase("computation")
+    try:
+        series = load_return_series(source, name=name)
+        asset = st.selectbox("Asset", series.columns)
+        networth = persisted(backtest_networth)(
+            series.returns[:, series.columns.index(asset)],
+            n_years,
+            sidebar.starting_value,
+            sidebar.monthly_invest,
+            sidebar.yearly_etra,
+        )
+    except ValueError as e:
+        st.error(str(e))
+        return
+
+    starts = series.months()[: len(networth)].astype(str)
+    if series.start is None:
+        starts = "month " + starts
+    invested = get_invested(
+        sidebar.starting_value, annual_invest, sidebar.yearly_etra, n_years
+    )[-1]
+    worst, best = np.argmin(networth), np.argmax(networth)
+
+    st.markdown(
+        f"Over the **{len(networth):,}** start months of the series, the median"
+        f" networth after {n_years} years is **{round(np.median(networth)):,} €**,"
+        f" with **{round(invested):,}** € invested."
+        f"\n\n- Worst window: starting **{starts[worst]}**,"
+        f" **{round(networth[worst]):,} €**"
+        f"\n- Best window: starting **{starts[best]}**,"
+        f" **{round(networth[best]):,} €**"
+    )
+
+    phase("chart build")
+    # the line keeps its shape with at most MAX_POINTS start months, and the
+    # histogram is binned here rather than by Vega from every start month
+    df = downsample_lines(
+        pd.DataFrame({"start": starts, "networth": networth.round()}),
+        "start",
+        "networth",
+    )
+    counts, edges = np.histogram(networth, bins=40)
+    df_hist = pd.DataFrame(
+        {"from": edges[:-1].round(), "to": edges[1:].round(), "start months": counts}
+    )
+    show_chart(
+        alt.hconcat(
+            alt.Chart(df)
+            .mark_line()
+            .encode(
+                x=alt.X("start:N", axis=None, sort=None),
+                y="networth:Q",
+                tooltip=["start", "networth"],
+            )
+            .properties(title="Final networth by start month", width=400, height=300),
+            alt.Chart(df_hist)
+            .mark_bar()
+            .encode(
+                x=alt.X("from:Q", title="networth"),
+                x2="to:Q",
+                y="start months:Q",
+                tooltip=["from", "to", "start months"],
+            )
+            .properties(title="Distribution of final networth", width=400, height=300),
+        )
+        .configure_axis(grid=False)
+        .configure_view(strokeWidth=0),
+        name="backtest",
+        use_container_width=True,
+    )
+
+    phase("table render")
+    st.dataframe(
+        pd.DataFrame(
+            {"networth": np.percentile(networth, PERCENTILES).round()},
+            index=[f"p{p}" for p in PERCENTILES],
+        ).T,
+        width=1500,
+    )
+
+
 @declare_view("Value growth")
 def show_regular(*args, **kwargs):
     sidebar = Box()
@@ -34,6 +259,14 @@ def show_regular(*args, **kwargs):
     start_year = 2021
     n_years = sidebar.n_years
 
+    if sidebar.mode == "Monte Carlo":
+        show_monte_carlo(sidebar, start_year)
+        return
+    if sidebar.mode == "Backtest":
+        show_backtest(sidebar)
+        return
+
+    phase("computation")
     data = []
     current_networth = sidebar.starting_value
     invested = float(sidebar.starting_value)
@@ -59,6 +292,8 @@ def show_regular(*args, **kwargs):
     st.markdown(
         f"Networth after {n_years} years is **{round(current_networth):,} €**, with **{round(invested):,}** € invested."
     )
+    phase("chart build")
     st.bar_chart(df[["invested", "gain"]])
 
+    phase("table render")
     st.dataframe(df, width=1500)
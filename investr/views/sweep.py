@@ -0,0 +1,149 @@
+import time
+
+import altair as alt
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from box import Box
+from investr.views.charts import bucket_grid, show_chart
+from investr.views.register import declare_view, phase
+from investr.common.mortgage import get_loan_totals
+from investr.common.store import persisted
+
+
+def make_sidebar(sidebar):
+    with st.sidebar.expander("Mortgage", True):
+        sidebar.loan_total = st.number_input(
+            "Amount", value=500_000, min_value=0, step=10_000
+        )
+        sidebar.annual_extra_repayment_rate = (
+            st.number_input(
+                "Annual extra repayment %", value=0.0, format="%.1f", step=0.1
+            )
+            / 100
+        )
+        sidebar.terms = st.multiselect(
+            "Number of years", [10, 15, 20, 25, 30, 35, 40], [10, 15, 20, 25, 30]
+        )
+
+    with st.sidebar.expander("Grid", True):
+        sidebar.min_interest_rate, sidebar.max_interest_rate = st.slider(
+            "Interest rate %", 0.0, 10.0, (0.5, 4.0), step=0.05
+        )
+        sidebar.min_monthly_payment, sidebar.max_monthly_payment = st.slider(
+            "Monthly payment", 100, 10_000, (1_000, 5_000), step=100
+        )
+        sidebar.resolution = st.slider(
+            "Grid resolution", min_value=10, max_value=200, value=50, step=10
+        )
+
+    return sidebar
+
+
+def make_heatmap(df, value, title):
+    return (
+        alt.Chart(df)
+        .mark_rect()
+        .encode(
+            x=alt.X(
+                "interest rate %:O", axis=alt.Axis(format=".2f", labelOverlap=True)
+            ),
+            y=alt.Y(
+                "monthly payment:O",
+                sort="descending",
+                axis=alt.Axis(format=",.0f", labelOverlap=True),
+            ),
+            color=alt.Color(f"{value}:Q", scale=alt.Scale(scheme="viridis")),
+            tooltip=["interest rate %", "monthly payment", f"{value}:Q"],
+        )
+        .properties(title=title, width=300, height=300)
+    )
+
+
+def show_heatmaps(
+    interest_rates,
+    monthly_payments,
+    n_years,
+    total_interests,
+    loan_balance,
+    payoff_year,
+):
+    phase("chart build")
+    # at most MAX_POINTS cells, averaged over blocks of the grid
+    rows, columns, (total_interests, loan_balance, payoff_year) = bucket_grid(
+        total_interests, loan_balance, payoff_year
+    )
+    rates, payments = np.meshgrid(
+        interest_rates[rows], monthly_payments[columns], indexing="ij"
+    )
+    df = pd.DataFrame(
+        {
+            "interest rate %": rates.ravel().round(2),
+            "monthly payment": payments.ravel().round(),
+            "loan balance": loan_balance.ravel().round(),
+            "total interests": total_interests.ravel().round(),
+            "payoff year": payoff_year.ravel().round(1),
+        }
+    )
+
+    with alt.data_transformers.disable_max_rows():
+        show_chart(
+            alt.hconcat(
+                make_heatmap(df, "loan balance", f"Loan balance after {n_years} years"),
+                make_heatmap(df, "total interests", "Total paid interests"),
+                # loans repaid before the end of their term, empty otherwise
+                make_heatmap(df, "payoff year", "Repaid in year"),
+            )
+            .configure_axis(grid=False)
+            .configure_view(strokeWidth=0),
+            name="sweep heatmaps",
+            use_container_width=True,
+        )
+
+
+@declare_view("Mortgage sweep")
+def show_mortgage_sweep(*args, **kwargs):
+    sidebar = Box()
+    sidebar = make_sidebar(sidebar)
+
+    if not sidebar.terms:
+        st.warning("Select at least one number of years.")
+        st.stop()
+
+    terms = np.array(sorted(sidebar.terms), dtype=float)
+    interest_rates = np.linspace(
+        sidebar.min_interest_rate, sidebar.max_interest_rate, sidebar.resolution
+    )
+    monthly_payments = np.linspace(
+        sidebar.min_monthly_payment, sidebar.max_monthly_payment, sidebar.resolution
+    )
+
+    phase("computation")
+    # (term, interest rate, monthly payment) grid in a single batched call
+    start = time.perf_counter()
+    total_interests, loan_balance, payoff_year = persisted(get_loan_totals)(
+        n_years=terms[:, None, None],
+        loan_total=sidebar.loan_total,
+        interest_rate=interest_rates[None, :, None] / 100,
+        monthly_payment=monthly_payments[None, None, :],
+        annual_extra_repayment_rate=sidebar.annual_extra_repayment_rate,
+        payoff_year=True,
+    )
+    elapsed = time.perf_counter() - start
+
+    st.markdown(
+        f"Evaluated **{loan_balance.size:,}** mortgages in **{elapsed * 1000:,.0f}** ms."
+    )
+
+    n_years = st.select_slider("Number of years", terms.astype(int).tolist())
+    t = int(np.searchsorted(terms, n_years))
+
+    show_heatmaps(
+        interest_rates,
+        monthly_payments,
+        n_years,
+        total_interests[t],
+        loan_balance[t],
+        payoff_year[t],
+    )
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from investr.common import store as store_module
+from investr.common.cache import call_key, make_key, memoize
+from investr.common.mortgage import optimize_extra_repayments, solve_loan
+from investr.common.store import ResultStore, persisted
+
+
+@pytest.fixture
+def result_store(tmp_path, monkeypatch):
+    result_store = ResultStore(str(tmp_path / "results.sqlite"), 2 ** 20)
+    monkeypatch.setattr(store_module, "store", result_store)
+    return result_store
+
+
+def test_call_key_includes_kwargs():
+    def func(a, **kwargs):
+        return a
+
+    key = call_key(func)
+    assert key((1,), {"b": 1}) != key((1,), {"b": 2})
+    assert key((1,), {"b": 1, "c": 2}) == key((1,), {"c": 2, "b": 1})
+    assert call_key(func, ignore_kwargs=True)((1,), {"b": 1}) == call_key(
+        func, ignore_kwargs=True
+    )((1,), {"b": 2})
+
+
+def test_memoize_kwargs():
+    calls = []
+
+    @memoize(maxsize=4)
+    def func(a, **kwargs):
+        calls.append(kwargs)
+        return a + kwargs.get("b", 0)
+
+    assert func(1, b=1) == 2
+    assert func(1, b=2) == 3
+    assert func(1, b=2) == 3
+    assert len(calls) == 2
+
+
+def test_persisted_solve_loan_kwargs(result_store):
+    loans = [
+        dict(n_years=20, loan_total=500_000, interest_rate=0.02),
+        dict(n_years=30, loan_total=150_000, interest_rate=0.03),
+    ]
+    for loan in loans:
+        expected = solve_loan("monthly_payment", **loan)
+        assert persisted(solve_loan)("monthly_payment", **loan) == pytest.approx(
+            expected
+        )
+    assert result_store.cache_info().currsize == 2
+
+
+def test_persisted_optimizer_kwargs(result_store):
+    inputs = [
+        dict(n_years=[10, 10], loan_total=[200_000, 300_000]),
+        dict(n_years=[15, 10], loan_total=[300_000, 100_000]),
+    ]
+    for loans in inputs:
+        kwargs = dict(interest_rate=[0.01, 0.03], monthly_payment=[1500, 2000])
+        expected = optimize_extra_repayments(10_000, **loans, **kwargs)
+        result = persisted(optimize_extra_repayments)(10_000, **loans, **kwargs)
+        for a, b in zip(result, expected):
+            np.testing.assert_allclose(a, b)
+
+
+def test_make_key_hashes_frames():
+    df = pd.DataFrame({"a": np.arange(1000.0)})
+    other = df.copy()
+    other.loc[500, "a"] = -1.0
+    assert make_key(df) != make_key(other)
+    assert make_key(df) == make_key(df.copy())
+    assert make_key(df["a"]) != make_key(other["a"])
+
+
+def test_make_key_rejects_unhashable():
+    with pytest.raises(TypeError):
+        make_key(object())
@@ -0,0 +1,20 @@
+import numpy as np
+
+from investr.common.growth import (
+    MIN_GROSS_RETURN,
+    simulate_annual_returns,
+    simulate_networth,
+)
+
+
+def test_normal_returns_are_floored():
+    # a 60% volatility loses more than everything in about 5% of the years
+    returns = simulate_annual_returns(0.05, 0.6, 30, 10_000, seed=0)
+    assert returns.min() == MIN_GROSS_RETURN
+    assert (returns > 1 + 0.05 + 3 * 0.6).any()
+
+    networth = simulate_networth(
+        returns, starting_value=10_000, annual_invest=1_200, yearly_extra=0
+    )
+    assert np.isfinite(networth).all()
+    assert (networth >= 0).all()
@@ -0,0 +1,121 @@
+import os
+
+import numpy as np
+import pytest
+
+from investr.common import history
+from investr.common.history import backtest_networth, load_return_series
+
+
+def reference_networth(
+    monthly_returns, n_years, starting_value, monthly_invest, yearly_extra
+):
+    # month by month loop over every start month of the series
+    n_months = 12 * n_years
+    networth = np.zeros(
+        (len(monthly_returns) - n_months + 1,) + monthly_returns.shape[1:]
+    )
+    for start in range(len(networth)):
+        value = np.full(monthly_returns.shape[1:], float(starting_value))
+        for month in range(n_months):
+            value = (value + monthly_invest) * (1 + monthly_returns[start + month])
+            if (month + 1) % 12 == 0:
+                value = value + yearly_extra
+        networth[start] = value
+    return networth
+
+
+@pytest.mark.parametrize("n_months", [12, 100, 131])
+@pytest.mark.parametrize("n_years", [1, 3, 10])
+def test_backtest_networth_matches_reference(n_months, n_years):
+    if n_months < 12 * n_years:
+        pytest.skip("shorter than the horizon")
+    rng = np.random.default_rng(n_months)
+    returns = rng.normal(0.005, 0.04, (n_months, 3))
+    params = dict(
+        n_years=n_years, starting_value=10_000, monthly_invest=500, yearly_extra=2_000
+    )
+    np.testing.assert_allclose(
+        backtest_networth(returns, **params),
+        reference_networth(returns, **params),
+        rtol=1e-12,
+    )
+
+
+def test_backtest_networth_too_short():
+    with pytest.raises(ValueError, match="fewer than the 120 months"):
+        backtest_networth(np.zeros((100, 1)), 10, 0, 100, 0)
+
+
+RETURNS_CSV = b"month,stocks,bonds\n2000-01,0.01,0.002\n2000-02,-0.02,0.003\n"
+
+
+def test_load_csv_upload_is_cached(tmp_path, monkeypatch):
+    series = load_return_series(RETURNS_CSV, "returns.csv", cache_dir=tmp_path)
+    assert series.columns == ["stocks", "bonds"]
+    assert isinstance(series.returns, np.memmap)
+    np.testing.assert_array_equal(series.returns, [[0.01, 0.002], [-0.02, 0.003]])
+    assert list(series.months().astype(str)) == ["2000-01", "2000-02"]
+    assert sorted(os.path.splitext(name)[1] for name in os.listdir(tmp_path)) == [
+        ".json",
+        ".npy",
+    ]
+
+    # the second load memory-maps the cached .npy without parsing the CSV
+    def read_csv(*args, **kwargs):
+        raise AssertionError("the CSV is parsed again")
+
+    monkeypatch.setattr(history.pd, "read_csv", read_csv)
+    cached = load_return_series(RETURNS_CSV, "returns.csv", cache_dir=tmp_path)
+    np.testing.assert_array_equal(cached.returns, series.returns)
+    assert cached.start == "2000-01"
+
+
+def test_load_csv_file_is_keyed_by_modification(tmp_path):
+    path = tmp_path / "returns.csv"
+    path.write_bytes(RETURNS_CSV)
+    cache_dir = tmp_path / "cache"
+    assert len(load_return_series(str(path), cache_dir=cache_dir)) == 2
+
+    path.write_bytes(RETURNS_CSV + b"2000-03,0.0,0.0\n")
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1))
+    assert len(load_return_series(str(path), cache_dir=cache_dir)) == 3
+
+
+def test_load_npy(tmp_path):
+    returns = np.arange(6, dtype=float).reshape(3, 2) / 100
+    path = tmp_path / "returns.npy"
+    np.save(path, returns)
+
+    series = load_return_series(str(path))
+    assert series.columns == ["asset 1", "asset 2"]
+    assert series.start is None
+    np.testing.assert_array_equal(series.returns, returns)
+
+    # an uploaded (month,) array holds a single asset
+    np.save(path, returns[:, 0])
+    upload = load_return_series(
+        path.read_bytes(), "upload.npy", cache_dir=tmp_path / "cache"
+    )
+    assert upload.returns.shape == (3, 1)
+
+
+@pytest.mark.parametrize(
+    "name, content, message",
+    [
+        ("empty.csv", b"month,stocks\n", "no rows"),
+        ("missing.csv", b"month,stocks\n2000-01,0.01\n2000-02,\n", "missing values"),
+    ],
+)
+def test_load_csv_errors(tmp_path, name, content, message):
+    with pytest.raises(ValueError, match=message):
+        load_return_series(content, name, cache_dir=tmp_path)
+    # nothing is cached for an invalid file
+    assert not os.listdir(tmp_path)
+
+
+def test_load_npy_error(tmp_path):
+    path = tmp_path / "returns.npy"
+    np.save(path, np.zeros((2, 3, 4)))
+    with pytest.raises(ValueError, match=r"got shape \(2, 3, 4\)"):
+        load_return_series(str(path))
@@ -0,0 +1,503 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from investr.common.mortgage import (
+    LOAN_SUMMARY_COLUMNS,
+    get_break_even_year,
+    get_loan_schedule,
+    get_loan_summaries,
+    get_loan_summary,
+    get_loan_totals,
+    get_refinancing_tree,
+    get_rent_vs_buy_scenarios,
+    get_roi,
+    optimize_extra_repayments,
+    solve_loan,
+)
+
+
+def reference_loan_summary(
+    n_years,
+    loan_total,
+    interest_rate,
+    monthly_payment,
+    annual_extra_repayment_rate=0,
+    interests_only_period=0,
+    start_month=1,
+    free_period=0,
+):
+    # the original year by year loop of get_loan_summary, (year, metric),
+    # stopped at payoff: the payments of the payoff year are cut to what is
+    # due, the regular payment first, then the extra repayment
+    loan_balance = loan_total
+    data = []
+    for y in range(1, int(n_years) + 1):
+        n_months = 12 if y > 1 else 13 - start_month
+
+        annual_interests = 0
+        if y > free_period:
+            annual_interests = loan_balance * interest_rate * (n_months / 12)
+        monthly_interests = annual_interests / n_months
+
+        monthly_principal = 0
+        annual_principal = 0
+        annual_extra_repayment = 0
+        if y > interests_only_period:
+            due = loan_balance + annual_interests
+            annual_payment = min(monthly_payment * n_months, due)
+            annual_principal = annual_payment - annual_interests
+            monthly_principal = annual_principal / n_months
+            annual_extra_repayment = min(
+                loan_total * annual_extra_repayment_rate, due - annual_payment
+            )
+            loan_balance = due - annual_payment - annual_extra_repayment
+
+        data.append(
+            [
+                monthly_interests,
+                monthly_principal,
+                annual_interests,
+                annual_principal,
+                annual_extra_repayment,
+                loan_balance,
+            ]
+        )
+    return np.array(data)
+
+
+REFERENCE_GRID = [
+    dict(
+        n_years=n_years,
+        loan_total=loan_total,
+        interest_rate=interest_rate,
+        monthly_payment=monthly_payment,
+        annual_extra_repayment_rate=annual_extra_repayment_rate,
+        interests_only_period=interests_only_period,
+        start_month=start_month,
+        free_period=free_period,
+    )
+    for n_years, loan_total, interest_rate, monthly_payment in [
+        (10, 500_000, 0.01, 2_000),
+        (25, 400_000, 0.035, 1_200),
+        (30, 1_000_000, 0.0, 1_000),
+        # repaid early
+        (10, 100_000, 0.02, 2_000),
+        (30, 400_000, 0.035, 3_000),
+        (20, 120_000, 0.0, 1_000),
+    ]
+    for annual_extra_repayment_rate in [0.0, 0.02]
+    for interests_only_period in [0, 3]
+    for start_month in [1, 9]
+    for free_period in [0, 2]
+]
+
+
+@pytest.mark.parametrize("loan", REFERENCE_GRID)
+def test_loan_summary_matches_reference(loan):
+    expected = reference_loan_summary(**loan)
+    summary = get_loan_summary(**loan)
+    assert list(summary.columns) == LOAN_SUMMARY_COLUMNS
+    assert list(summary.index) == list(range(1, loan["n_years"] + 1))
+    np.testing.assert_allclose(summary.to_numpy(), expected, rtol=1e-9, atol=1e-6)
+
+
+def test_reference_grid_covers_early_payoff():
+    repaid = [reference_loan_summary(**loan)[-1, -1] == 0 for loan in REFERENCE_GRID]
+    assert any(repaid) and not all(repaid)
+
+
+def test_loan_summaries_match_reference():
+    summaries = get_loan_summaries(
+        **{name: [loan[name] for loan in REFERENCE_GRID] for name in REFERENCE_GRID[0]}
+    )
+    for loan, summary in zip(REFERENCE_GRID, summaries):
+        np.testing.assert_allclose(
+            summary[: loan["n_years"]],
+            reference_loan_summary(**loan),
+            rtol=1e-9,
+            atol=1e-6,
+        )
+
+
+def reference_roi(
+    yearly_agg_summary,
+    property_value,
+    first_fee,
+    yearly_cold_rent,
+    n_years,
+    rent_increase_rate,
+    yearly_maintenance_cost,
+    yearly_property_tax,
+    surface,
+    property_appreciation_rate,
+):
+    # the original year by year loop of get_roi
+    interests = 0
+    rent = 0
+    extra_costs = 0
+    property_value_ = property_value
+    rows = []
+    for y in range(1, n_years + 1):
+        interests += yearly_agg_summary.loc[y, "interests"]
+        initial_share_value = property_value - yearly_agg_summary.loc[y, "loan balance"]
+        new_share_value = initial_share_value * (1 + property_appreciation_rate) ** y
+        diff_share_value = new_share_value - initial_share_value
+        rent += yearly_cold_rent * (1 + rent_increase_rate) ** (y - 1)
+        extra_costs += yearly_maintenance_cost + yearly_property_tax
+        networth = -first_fee + diff_share_value + rent - interests - extra_costs
+        property_value_ += property_value * property_appreciation_rate
+        rows.append(
+            dict(
+                year=y,
+                **{
+                    "amount invested": initial_share_value,
+                    "property share": diff_share_value,
+                    "interests": -interests,
+                    "rent": rent,
+                    "extra costs": -extra_costs,
+                    "networth": networth,
+                    "property": property_value_,
+                    "m2 price": round(property_value_ / surface, 2),
+                },
+            )
+        )
+    return pd.DataFrame(rows)
+
+
+ROI_LOAN = dict(
+    n_years=25,
+    loan_total=400_000,
+    interest_rate=0.02,
+    monthly_payment=1_800,
+    annual_extra_repayment_rate=0.01,
+    interests_only_period=1,
+    start_month=9,
+    free_period=1,
+)
+
+ROI_GRID = [
+    dict(
+        property_value=property_value,
+        first_fee=first_fee,
+        yearly_cold_rent=yearly_cold_rent,
+        n_years=n_years,
+        rent_increase_rate=rent_increase_rate,
+        yearly_maintenance_cost=2_000,
+        yearly_property_tax=500,
+        surface=80,
+        property_appreciation_rate=property_appreciation_rate,
+    )
+    for property_value, first_fee in [(450_000, 40_000), (600_000, 0)]
+    for yearly_cold_rent in [0, 15_000]
+    for n_years in [1, 10, 25]
+    for rent_increase_rate in [0.0, 0.02]
+    for property_appreciation_rate in [-0.01, 0.0, 0.03]
+]
+
+
+def roi_agg_summary():
+    summary = get_loan_summary(**ROI_LOAN)
+    return pd.DataFrame(
+        {
+            "interests": summary["annual_interests"],
+            "loan balance": summary["loan balance"],
+        }
+    )
+
+
+def assert_roi_equal(roi, expected):
+    assert list(roi.columns) == list(expected.columns)
+    np.testing.assert_allclose(
+        roi.drop(columns="m2 price").to_numpy(dtype=float),
+        expected.drop(columns="m2 price").to_numpy(dtype=float),
+        rtol=1e-9,
+        atol=1e-6,
+    )
+    # rounded to cents, the linear property value is summed differently
+    np.testing.assert_allclose(roi["m2 price"], expected["m2 price"], atol=0.01)
+
+
+@pytest.mark.parametrize("params", ROI_GRID)
+def test_roi_matches_reference(params):
+    agg_summary = roi_agg_summary()
+    assert_roi_equal(
+        get_roi(agg_summary, **params), reference_roi(agg_summary, **params)
+    )
+
+
+def test_roi_scenarios_match_reference():
+    agg_summary = roi_agg_summary()
+    appreciation_rates = np.array([-0.01, 0.0, 0.03])
+    rent_increase_rates = np.array([0.0, 0.02])
+    params = dict(ROI_GRID[-1], n_years=20)
+    roi = get_roi(
+        agg_summary,
+        **dict(
+            params,
+            property_appreciation_rate=appreciation_rates[:, None],
+            rent_increase_rate=rent_increase_rates,
+        ),
+    )
+    expected = pd.concat(
+        [
+            reference_roi(
+                agg_summary,
+                **dict(
+                    params,
+                    property_appreciation_rate=appreciation_rate,
+                    rent_increase_rate=rent_increase_rate,
+                ),
+            ).assign(
+                **{
+                    "property appreciation rate": appreciation_rate,
+                    "rent increase rate": rent_increase_rate,
+                }
+            )
+            for appreciation_rate in appreciation_rates
+            for rent_increase_rate in rent_increase_rates
+        ],
+        ignore_index=True,
+    )
+    assert_roi_equal(roi, expected[roi.columns])
+
+
+# repaid after about 10 of its 30 years
+EARLY_PAYOFF = dict(
+    n_years=30,
+    loan_total=500_000,
+    interest_rate=0.04,
+    monthly_payment=5_000,
+    annual_extra_repayment_rate=0.01,
+    interests_only_period=1,
+    start_month=9,
+)
+
+
+@pytest.mark.parametrize("resolution", ["yearly", "monthly"])
+def test_schedule_stops_at_payoff(resolution):
+    schedule = get_loan_schedule(**EARLY_PAYOFF, resolution=resolution)
+    assert schedule["loan balance"][-1] == 0
+    assert (schedule["loan balance"] >= 0).all()
+    assert (schedule["annual_interests"] >= 0).all()
+    repaid = schedule["loan balance"] == 0
+    assert repaid[12:].all() and not repaid[:8].any()
+    for column in ["annual_interests", "annual_principal", "extra repayment"]:
+        assert (schedule[column][np.argmax(repaid) + 1 :] == 0).all()
+
+    # the payments add up to the loan and its interests
+    paid = schedule["annual_principal"] + schedule["extra repayment"]
+    assert paid.sum() == pytest.approx(EARLY_PAYOFF["loan_total"])
+
+
+def test_totals_match_schedule_at_payoff():
+    schedule = get_loan_schedule(**EARLY_PAYOFF)
+    total_interests, loan_balance = get_loan_totals(**EARLY_PAYOFF)
+    assert total_interests == pytest.approx(schedule["annual_interests"].sum())
+    assert loan_balance == pytest.approx(0)
+
+
+def test_refinancing_tree_follow_up_payoff():
+    loan = dict(
+        n_years=10, loan_total=400_000, interest_rate=0.01, monthly_payment=2_000
+    )
+    tree = get_refinancing_tree(
+        **loan, follow_up_rates=[0.02, 0.05], follow_up_years=[15, 10]
+    )
+
+    first = get_loan_schedule(**loan)
+    for leaf, (branch,) in enumerate(tree["branches"]):
+        follow_up = get_loan_schedule(
+            n_years=[15, 10][branch],
+            loan_total=first["loan balance"][-1],
+            interest_rate=[0.02, 0.05][branch],
+            monthly_payment=loan["monthly_payment"],
+        )
+        assert tree["total interests"][leaf] == pytest.approx(
+            first["annual_interests"].sum() + follow_up["annual_interests"].sum()
+        )
+        assert tree["loan balance"][leaf] == pytest.approx(
+            follow_up["loan balance"][-1]
+        )
+    # the 2% follow-up is repaid early
+    assert tree["loan balance"][0] == 0
+
+
+def test_totals_payoff_year():
+    schedule = get_loan_schedule(**EARLY_PAYOFF)
+    _, _, payoff_year = get_loan_totals(**EARLY_PAYOFF, payoff_year=True)
+    assert payoff_year == np.argmax(schedule["loan balance"] == 0) + 1
+
+    # not repaid within the term
+    _, loan_balance, payoff_year = get_loan_totals(
+        **dict(EARLY_PAYOFF, n_years=5), payoff_year=True
+    )
+    assert loan_balance > 0 and np.isnan(payoff_year)
+
+
+GOAL_SEEK_LOAN = dict(
+    n_years=20,
+    loan_total=500_000,
+    interest_rate=0.03,
+    monthly_payment=2_500,
+    interests_only_period=2,
+    start_month=9,
+    free_period=1,
+)
+
+
+def test_solve_n_years_with_max_total_interests():
+    n_years = solve_loan("n_years", **GOAL_SEEK_LOAN)
+    total_interests, loan_balance = get_loan_totals(
+        **dict(GOAL_SEEK_LOAN, n_years=n_years)
+    )
+    assert loan_balance == 0
+
+    solved = solve_loan(
+        "n_years", max_total_interests=total_interests + 1, **GOAL_SEEK_LOAN
+    )
+    assert solved == n_years
+    assert np.isnan(
+        solve_loan("n_years", max_total_interests=total_interests - 1, **GOAL_SEEK_LOAN)
+    )
+
+
+@pytest.mark.parametrize(
+    "solve_for", ["monthly_payment", "annual_extra_repayment_rate"]
+)
+def test_solve_max_total_interests(solve_for):
+    solved = solve_loan(solve_for, max_total_interests=100_000, **GOAL_SEEK_LOAN)
+    total_interests, loan_balance = get_loan_totals(
+        **dict(GOAL_SEEK_LOAN, **{solve_for: solved})
+    )
+    assert total_interests == pytest.approx(100_000)
+    assert loan_balance >= 0
+
+    # less than the interests of the interest-only period
+    assert np.isnan(solve_loan(solve_for, max_total_interests=1_000, **GOAL_SEEK_LOAN))
+
+
+TRANCHES = dict(
+    n_years=[20, 25, 30],
+    loan_total=[200_000, 300_000, 150_000],
+    interest_rate=[0.035, 0.02, 0.045],
+    monthly_payment=[1_200, 1_300, 800],
+)
+
+
+@pytest.mark.parametrize("objective", ["total_interests", "loan_balance"])
+def test_optimize_extra_repayments_is_exact(objective):
+    budget, n_steps = 12_000, 6
+    caps = [8_000, 12_000, 4_000]
+    allocation, total_interests, loan_balance = optimize_extra_repayments(
+        budget, caps=caps, objective=objective, n_steps=n_steps, **TRANCHES
+    )
+    assert allocation.sum() <= budget
+    assert np.all(allocation <= caps)
+
+    def value(units):
+        extra = np.array(units) * budget / n_steps
+        totals = get_loan_totals(
+            annual_extra_repayment_rate=extra / np.array(TRANCHES["loan_total"]),
+            **TRANCHES,
+        )
+        return totals[0 if objective == "total_interests" else 1].sum()
+
+    best = min(
+        value(units)
+        for units in itertools.product(range(n_steps + 1), repeat=3)
+        if sum(units) == n_steps and np.all(np.array(units) * budget / n_steps <= caps)
+    )
+    optimized = total_interests if objective == "total_interests" else loan_balance
+    assert optimized.sum() == pytest.approx(best)
+
+
+def test_optimize_extra_repayments_caps_tranches():
+    with pytest.raises(ValueError):
+        optimize_extra_repayments(
+            1_000,
+            **{key: value * 51 for key, value in TRANCHES.items()},
+        )
+
+
+RENT_VS_BUY_LOAN = pd.DataFrame(
+    {
+        "annual_interests": [1_000, 900],
+        "annual_principal": [5_000, 5_000],
+        "extra repayment": [0, 0],
+        "loan balance": [95_000, 90_000],
+    }
+)
+
+
+@pytest.mark.parametrize(
+    "yearly_cold_rent, rent_increase_rate, rent_networth, buy_networth",
+    [
+        # the buyer pays 7,000 then 6,900 a year: the renter invests the rest
+        (4_000, 0.1, [24_000, 27_700], [7_000, 14_040]),
+        # the renter pays more: the buyer invests the difference
+        (8_000, 0.0, [21_000, 22_050], [8_000, 16_190]),
+    ],
+)
+def test_rent_vs_buy_scenarios(
+    yearly_cold_rent, rent_increase_rate, rent_networth, buy_networth
+):
+    scenarios = get_rent_vs_buy_scenarios(
+        RENT_VS_BUY_LOAN,
+        property_value=100_000,
+        initial_cash=20_000,
+        yearly_cold_rent=yearly_cold_rent,
+        rent_increase_rate=rent_increase_rate,
+        yearly_maintenance_cost=500,
+        yearly_property_tax=500,
+        property_appreciation_rate=0.02,
+        market_return=0.05,
+    )
+    np.testing.assert_array_equal(scenarios["year"], [1, 2])
+    np.testing.assert_allclose(scenarios["buy costs"], [7_000, 6_900])
+    np.testing.assert_allclose(scenarios["property"], [102_000, 104_040])
+    np.testing.assert_allclose(scenarios["rent networth"], rent_networth)
+    np.testing.assert_allclose(scenarios["buy networth"], buy_networth)
+    np.testing.assert_allclose(
+        scenarios["difference"], np.subtract(buy_networth, rent_networth)
+    )
+
+
+def test_rent_vs_buy_scenarios_broadcast():
+    scenarios = get_rent_vs_buy_scenarios(
+        RENT_VS_BUY_LOAN,
+        property_value=100_000,
+        initial_cash=20_000,
+        yearly_cold_rent=[4_000, 8_000],
+        rent_increase_rate=[[0.1], [0.0]],
+        yearly_maintenance_cost=500,
+        yearly_property_tax=500,
+        property_appreciation_rate=0.02,
+        market_return=0.05,
+    )
+    assert scenarios["difference"].shape == (2, 2, 2)
+    np.testing.assert_allclose(scenarios["rent networth"][0, 0], [24_000, 27_700])
+    np.testing.assert_allclose(scenarios["buy networth"][1, 1], [8_000, 16_190])
+
+
+@pytest.mark.parametrize(
+    "difference, break_even_year",
+    [
+        ([-3, -1, 2, -1, 5, 6], 5),
+        # never behind
+        ([1, 2, 3], 1),
+        # never ahead
+        ([-3, -2, -1], np.nan),
+        # ahead, then behind at the end of the horizon
+        ([1, 2, -1], np.nan),
+    ],
+)
+def test_break_even_year(difference, break_even_year):
+    np.testing.assert_equal(get_break_even_year(np.array(difference)), break_even_year)
+    # scenarios along the leading axes
+    np.testing.assert_equal(
+        get_break_even_year(np.array([difference, [1] * len(difference)])),
+        [break_even_year, 1],
+    )
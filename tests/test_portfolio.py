@@ -0,0 +1,160 @@
+import json
+
+import numpy as np
+import pytest
+
+from investr.common.portfolio import (
+    PortfolioError,
+    load_portfolio,
+    parse_portfolio,
+)
+
+MORTGAGES = {
+    "first": dict(amount=300_000, interest=1.5, n_years=20, monthly=1_500),
+    "second": dict(amount=200_000, interest=2.0, n_years=10, monthly=1_800),
+}
+
+
+def as_format(fmt, mortgages, mapping=True):
+    # the bytes of a configuration file with the given entries
+    if fmt == "csv":
+        fields = sorted({field for entry in mortgages.values() for field in entry})
+        rows = [",".join(fields)] + [
+            ",".join(str(entry.get(field, "")) for field in fields)
+            for entry in mortgages.values()
+        ]
+        return "\n".join(rows).encode()
+    data = mortgages if mapping else list(mortgages.values())
+    return json.dumps(data).encode()
+
+
+@pytest.mark.parametrize("fmt", ["csv", "json", "yaml"])
+def test_parse_portfolio(fmt):
+    portfolio = parse_portfolio(as_format(fmt, MORTGAGES), fmt)
+    assert portfolio.names == ("Mortgage 1", "Mortgage 2")
+    loans = portfolio.loans()
+    np.testing.assert_array_equal(loans["loan_total"], [300_000, 200_000])
+    np.testing.assert_array_equal(loans["interest_rate"], [0.015, 0.02])
+    np.testing.assert_array_equal(loans["n_years"], [20, 10])
+    np.testing.assert_array_equal(loans["monthly_payment"], [1_500, 1_800])
+
+
+def test_parse_portfolio_names():
+    mortgages = {
+        "a": dict(MORTGAGES["first"], name="Tranche {}"),
+        "b": dict(MORTGAGES["first"], name="{fixed} rate"),
+        "c": MORTGAGES["second"],
+    }
+    portfolio = parse_portfolio(as_format("json", mortgages), "json")
+    assert portfolio.names == ("Tranche 1", "{fixed} rate", "Mortgage 3")
+
+
+def test_parse_portfolio_is_read_only():
+    # the cached instance is shared by every caller
+    content = as_format("json", MORTGAGES)
+    portfolio = parse_portfolio(content, "json")
+    with pytest.raises(ValueError, match="read-only"):
+        portfolio.amount[0] = 0
+    assert parse_portfolio(content, "json").amount[0] == 300_000
+
+
+def invalid(field, value, entry="first"):
+    return {**MORTGAGES, entry: dict(MORTGAGES[entry], **{field: value})}
+
+
+def without(field):
+    entry = dict(MORTGAGES["second"])
+    del entry[field]
+    return {**MORTGAGES, "second": entry}
+
+
+@pytest.mark.parametrize(
+    "mortgages, fmt, mapping, message",
+    [
+        ({}, "json", True, "The portfolio has no mortgages"),
+        (
+            invalid("rate", 1.0),
+            "json",
+            True,
+            r"Unknown fields \['rate'\], expected",
+        ),
+        (
+            without("monthly"),
+            "json",
+            False,
+            "Mortgage entry 2: missing field 'monthly'",
+        ),
+        (without("monthly"), "csv", True, "Mortgage row 3: missing field 'monthly'"),
+        (
+            invalid("amount", "a lot"),
+            "json",
+            True,
+            "Mortgage 'first': 'amount' must be a number, got 'a lot'",
+        ),
+        (
+            invalid("amount", "a lot"),
+            "csv",
+            True,
+            "Mortgage row 2: 'amount' must be a number, got 'a lot'",
+        ),
+        (
+            invalid("interest", -1, "second"),
+            "yaml",
+            True,
+            "Mortgage 'second': 'interest' must not be negative, got -1",
+        ),
+        (
+            invalid("monthly", -100),
+            "yaml",
+            False,
+            "Mortgage entry 1: 'monthly' must not be negative, got -100",
+        ),
+        (
+            invalid("n_years", 41),
+            "json",
+            True,
+            "'n_years' must be a whole number of years between 1 and 40, got 41",
+        ),
+        (
+            invalid("n_years", 0),
+            "json",
+            True,
+            "'n_years' must be a whole number of years between 1 and 40, got 0",
+        ),
+        (
+            invalid("n_years", 12.5),
+            "csv",
+            True,
+            "Mortgage row 2: 'n_years' must be a whole number of years",
+        ),
+    ],
+)
+def test_parse_portfolio_errors(mortgages, fmt, mapping, message):
+    with pytest.raises(PortfolioError, match=message):
+        parse_portfolio(as_format(fmt, mortgages, mapping), fmt)
+
+
+@pytest.mark.parametrize(
+    "content, fmt, message",
+    [
+        (b"{", "json", "Cannot parse the JSON file"),
+        (b"a: [", "yaml", "Cannot parse the YAML file"),
+        (b'a,b\n"x', "csv", "Cannot parse the CSV file"),
+        (b"12", "yaml", "Expected a mapping or a list of mortgages"),
+        (b"[1, 2]", "json", "Mortgage entry 1: expected a mapping of fields"),
+        (b"{}", "toml", "Unknown portfolio format: toml"),
+    ],
+)
+def test_parse_portfolio_format_errors(content, fmt, message):
+    with pytest.raises(PortfolioError, match=message):
+        parse_portfolio(content, fmt)
+
+
+def test_load_portfolio(tmp_path):
+    path = tmp_path / "portfolio.YML"
+    path.write_bytes(as_format("yaml", MORTGAGES))
+    assert len(load_portfolio(str(path))) == 2
+    assert len(load_portfolio(path.read_bytes(), "upload.yml")) == 2
+
+    with pytest.raises(PortfolioError, match="Unsupported portfolio file"):
+        load_portfolio(b"", "portfolio.txt")
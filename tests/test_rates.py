@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from investr.common.rates import parse_rate_steps, simulate_rate_paths, step_rate_path
+
+
+def test_parse_rate_steps():
+    assert parse_rate_steps("1: 1.0, 5: 3.5; 10:4") == {1: 0.01, 5: 0.035, 10: 0.04}
+
+
+@pytest.mark.parametrize(
+    "text, message",
+    [
+        ("1: 1.0, five: 3", "Invalid rate step 'five: 3', expected 'year: rate %'"),
+        ("1 1.0", "expected 'year: rate %'"),
+        ("0: 1.0", "years start at 1"),
+        (" , ", "The rate schedule has no steps"),
+    ],
+)
+def test_parse_rate_steps_errors(text, message):
+    with pytest.raises(ValueError, match=message):
+        parse_rate_steps(text)
+
+
+def test_step_rate_path_boundaries():
+    # each rate applies from its year on, years counted from 1
+    path = step_rate_path({1: 0.01, 3: 0.02, 6: 0.05}, 7)
+    np.testing.assert_array_equal(path, [0.01, 0.01, 0.02, 0.02, 0.02, 0.05, 0.05])
+
+    # the years before the first step have the initial rate
+    path = step_rate_path({3: 0.02}, 4, initial_rate=0.04)
+    np.testing.assert_array_equal(path, [0.04, 0.04, 0.02, 0.02])
+    np.testing.assert_array_equal(step_rate_path({3: 0.02}, 4), [0.02] * 4)
+
+
+@pytest.mark.parametrize("model", ["vasicek", "cir"])
+def test_rate_paths_without_volatility_converge_to_mean(model):
+    paths = simulate_rate_paths(
+        model, [0.01, 0.06], mean=0.03, speed=0.5, volatility=0.0, n_years=30, n_paths=4
+    )
+    assert paths.shape == (4, 2, 30)
+    # every path is the deterministic mean reversion
+    np.testing.assert_array_equal(paths, np.broadcast_to(paths[0], paths.shape))
+    np.testing.assert_allclose(paths[0, :, -1], 0.03, atol=1e-6)
+    assert (np.diff(paths[0, 0]) > 0).all() and (np.diff(paths[0, 1]) < 0).all()
+
+
+def test_vasicek_without_volatility_is_exact():
+    # yearly average of r(t) = mean + (r0 - mean) exp(-speed t) at the end of
+    # every monthly step
+    paths = simulate_rate_paths(
+        "vasicek", 0.05, mean=0.02, speed=0.3, volatility=0.0, n_years=3, n_paths=1
+    )
+    months = np.arange(1, 37) / 12
+    expected = (0.02 + 0.03 * np.exp(-0.3 * months)).reshape(3, 12).mean(axis=-1)
+    np.testing.assert_allclose(paths[0], expected, rtol=1e-12)
+
+
+def test_simulate_rate_paths_unknown_model():
+    with pytest.raises(ValueError, match="Unknown rate model: hull-white"):
+        simulate_rate_paths("hull-white", 0.01, 0.03, 0.5, 0.01, 10, 10)
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from investr.common.mortgage import LOAN_SUMMARY_COLUMNS, get_loan_schedule
+from investr.common.tax import get_depreciation, get_rental_cash_flows
+
+
+def test_depreciation_is_capped_at_the_building_value():
+    depreciation = get_depreciation(300_000, 0.03, 40)
+    # 9,000 a year for 33 years, the 3,000 left in year 34, then nothing
+    np.testing.assert_allclose(depreciation[:33], 9_000)
+    assert depreciation[33] == pytest.approx(3_000)
+    np.testing.assert_array_equal(depreciation[34:], 0)
+    assert depreciation.sum() == pytest.approx(300_000)
+
+
+def test_depreciation_scenarios():
+    depreciation = get_depreciation([100_000, 200_000], [[0.5], [0.02]], 3)
+    assert depreciation.shape == (2, 2, 3)
+    np.testing.assert_allclose(depreciation[0, 0], [50_000, 50_000, 0])
+    np.testing.assert_allclose(depreciation[1, 1], [4_000, 4_000, 4_000])
+
+
+def summary(n_years, annual_interests, annual_principal, extra_repayment):
+    # (year, metric) loan summary with constant yearly flows
+    values = np.zeros((n_years, len(LOAN_SUMMARY_COLUMNS)))
+    for name, value in [
+        ("annual_interests", annual_interests),
+        ("annual_principal", annual_principal),
+        ("extra repayment", extra_repayment),
+    ]:
+        values[:, LOAN_SUMMARY_COLUMNS.index(name)] = value
+    return values
+
+
+@pytest.mark.parametrize(
+    "yearly_rent, tax, cash_flow",
+    [
+        # taxable 20,000 - 3,000 - 6,000 - 4,000 = 7,000 taxed at 40%
+        (20_000, 2_800, 6_000),
+        # a loss of 3,000 is refunded at the marginal rate
+        (10_000, -1_200, -4_000),
+    ],
+)
+def test_rental_cash_flows(yearly_rent, tax, cash_flow):
+    flows = get_rental_cash_flows(
+        summary(2, 6_000, 4_000, 1_000),
+        building_value=200_000,
+        yearly_rent=yearly_rent,
+        rent_increase_rate=0.0,
+        yearly_costs=3_000,
+        depreciation_rate=0.02,
+        marginal_tax_rate=0.4,
+    )
+    np.testing.assert_allclose(flows["depreciation"], 4_000)
+    np.testing.assert_allclose(flows["repayment"], 5_000)
+    np.testing.assert_allclose(flows["tax"], tax)
+    np.testing.assert_allclose(flows["cash flow"], cash_flow)
+    np.testing.assert_allclose(flows["after-tax cash flow"], cash_flow - tax)
+
+
+def test_rental_cash_flows_of_a_schedule():
+    loan = dict(
+        n_years=10, loan_total=300_000, interest_rate=0.03, monthly_payment=2_000
+    )
+    schedule = get_loan_schedule(**loan)
+    params = dict(
+        building_value=250_000,
+        yearly_rent=[12_000, 18_000],
+        rent_increase_rate=0.02,
+        yearly_costs=2_000,
+        depreciation_rate=0.02,
+        marginal_tax_rate=0.42,
+    )
+    flows = get_rental_cash_flows(schedule, **params)
+    assert flows["tax"].shape == (2, 10)
+    np.testing.assert_allclose(flows["interests"][0], schedule["annual_interests"])
+    np.testing.assert_allclose(
+        flows["after-tax cash flow"], flows["cash flow"] - flows["tax"]
+    )
+    np.testing.assert_allclose(
+        flows["tax"],
+        0.42
+        * (flows["rent"] - flows["costs"] - flows["interests"] - flows["depreciation"]),
+    )